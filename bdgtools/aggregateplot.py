@@ -2,15 +2,22 @@ import numpy as np
 import pandas as pd
 import logging
 from .regions import Regions, expand
-from .util import get_ranks
+from .bedgraph import BedGraph, BedGraphArray
+from .genome import Genome
+from .io import zip_bedgraphs
+from .util import get_ranks, kmeans
 log = logging
 
 class AggregatePlot:
     _figure_width=2000
     _region_size=None
     _aspect_ratio=None
-    def __init__(self, figure_width=2000, region_size=None, do_normalize=True):
+    # Rough peak memory per extracted breakpoint over extract_regions, scale_x and update_dense_diffs
+    _bytes_per_breakpoint = 64
+    def __init__(self, figure_width=2000, region_size=None, do_normalize=True, dtype="float64", max_memory=None):
         self._figure_width = figure_width
+        self._dtype = np.dtype(dtype)
+        self._max_memory = max_memory
         self._figure_shape = (figure_width,)
         self._do_normalize = do_normalize
         self._row_counts = 0
@@ -19,17 +26,64 @@ class AggregatePlot:
             self._region_size = region_size
 
     def __call__(self, bedgraphs, regions):
-        self._diffs = np.zeros(self._figure_shape)
-        self._pre_process(bedgraphs, regions)
+        self._start(bedgraphs, regions)
         for chrom, bedgraph in bedgraphs:
-            if self._do_normalize:
-                self._coverage += bedgraph.sum()
-            if chrom not in regions:
-                continue
-            log.info("Processing %s", chrom)
-            self._update_chromosome(chrom, bedgraph, self._transform_regions(regions[chrom]))
+            self._update(chrom, bedgraph, regions[chrom] if chrom in regions else None)
+        return self._finalize()
+
+    def _start(self, bedgraphs, regions):
+        self._diffs = np.zeros(self._figure_shape, dtype=self._dtype)
+        self._pre_process(bedgraphs, regions)
+
+    def _update(self, chrom, bedgraph, regions):
+        if self._do_normalize:
+            self._coverage += bedgraph.sum()
+        if regions is None:
+            return
+        log.info("Processing %s", chrom)
+        self._update_batched(chrom, bedgraph, self._transform_regions(regions))
+
+    def _get_batches(self, bedgraph, regions):
+        if self._max_memory is None or not isinstance(regions, Regions) or not isinstance(bedgraph, BedGraph):
+            return [slice(None)]
+        half_windows = np.maximum(regions.sizes(), self._region_size or 0)//2+1
+        mids = (regions.starts+regions.ends)//2
+        counts = np.searchsorted(bedgraph._indices, mids+half_windows)-np.searchsorted(bedgraph._indices, mids-half_windows)+1
+        batch_ids = (np.cumsum(counts)-1)//max(self._max_memory//self._bytes_per_breakpoint, 1)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(batch_ids))+1, [len(regions)]))
+        return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def _update_batched(self, chrom, bedgraph, regions):
+        batches = self._get_batches(bedgraph, regions)
+        if len(batches) == 1:
+            return self._update_chromosome(chrom, bedgraph, regions)
+        log.info("Processing %s in %s batches", chrom, len(batches))
+        for batch in batches:
+            self._update_chromosome(chrom, bedgraph, regions[batch])
+
+    def call_flat(self, bedgraphs, regions, chrom_sizes):
+        assert all(isinstance(r, Regions) for r in regions.values()), "Only plain regions can be flattened"
+        self._diffs = np.zeros(self._figure_shape, dtype=self._dtype)
+        bedgraphs = dict(bedgraphs)
+        self._pre_process(bedgraphs, regions)
+        # Like the per chromosome path, regions on chromosomes without a track are skipped
+        genome = Genome({chrom: size for chrom, size in dict(chrom_sizes).items() if chrom in bedgraphs},
+                        self._get_padding(regions))
+        bedgraph = genome.flatten_bedgraphs(bedgraphs.items())
+        if self._do_normalize:
+            self._coverage += bedgraph.sum()
+        self._flatten_state(genome)
+        flat_regions = genome.flatten_regions(regions)
+        self._update_batched(genome.name, bedgraph, self._transform_regions(flat_regions))
         return self._finalize()
 
+    def _get_padding(self, regions):
+        max_size = max((np.max(r.sizes()) for r in regions.values() if len(r)), default=0)
+        return max(self._region_size or 0, max_size)+1
+
+    def _flatten_state(self, genome):
+        pass
+
     def get_x_axis(self):
         return np.arange(self._figure_width)*self._region_size//self._figure_width-self._region_size//2
 
@@ -40,7 +94,7 @@ class AggregatePlot:
         pass
 
     def _finalize(self):
-        values = np.cumsum(self._diffs, axis=-1)/np.maximum(self._row_counts, 1)[:, None]
+        values = np.cumsum(self._diffs, axis=-1)/np.maximum(self._row_counts, 1).astype(self._dtype)[:, None]
         if self._do_normalize:
             values/=(self._coverage/1000000)
         table = pd.DataFrame(values)
@@ -64,37 +118,85 @@ class VPlot(MatrixPlot):
     ylabel="Domain size"
     _aspect_ratio=1
     _region_size = None
+    _min_size = 1
 
+    def __init__(self, *args, size_bins="linear", max_quantile=None, window_scale=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        assert size_bins in ("linear", "log"), size_bins
+        self._size_bins = size_bins
+        self._max_quantile = max_quantile
+        self._window_scale = window_scale
 
     def _pre_process(self, bedgraphs, regions):
+        sizes = np.concatenate([r.sizes() for r in regions.values()])
+        if self._size_bins == "log" and sizes.size:
+            # Log bins start at the smallest domain, so the first rows are not spent on sizes that never occur
+            self._min_size = int(np.min(sizes))
         if self._region_size is not None:
             return
-        self._region_size = max(np.max(r.sizes()) for r in regions.values())
-        print(self._region_size)
+        if self._max_quantile is None:
+            self._region_size = int(np.max(sizes))
+        else:
+            self._region_size = int(np.quantile(sizes, self._max_quantile))
+
+    def _get_row_edges(self):
+        n_rows = self._row_counts.size
+        if self._size_bins == "log":
+            return self._min_size*np.exp(np.arange(n_rows+1)/n_rows*self._get_log_range())
+        return np.arange(n_rows+1)*self._region_size/n_rows
+
+    def _get_log_range(self):
+        return np.log(max(self._region_size+1, self._min_size+1)/self._min_size)
 
+    def _get_rows(self, sizes):
+        if self._size_bins == "log":
+            return np.floor(np.log(sizes/self._min_size)/self._get_log_range()*self._figure_shape[0]).astype("int")
+        return ((sizes)/self._region_size*self._figure_shape[0]).astype("int")
+
+    def get_x_axis(self):
+        if self._window_scale is None:
+            return super().get_x_axis()
+        return (np.arange(self._figure_width)/self._figure_width-0.5)*self._window_scale
 
     def get_y_axis(self):
+        if self._size_bins == "log":
+            return self._get_row_edges()[:-1].astype("int")
         return np.arange(self._row_counts.size)*self._region_size//self._row_counts.size
 
     def _update_chromosome(self, chrom, bedgraph, regions):
-        rows = ((regions.ends-regions.starts)/self._region_size*self._figure_shape[0]).astype("int")
-        mask = rows<self._figure_shape[0]
+        rows = self._get_rows(regions.ends-regions.starts)
+        mask = (rows >= 0) & (rows < self._figure_shape[0])
+        rows = rows[mask]
+        if not rows.size:
+            return
         mids = (regions.ends[mask]+regions.starts[mask])//2
-        new_regions = Regions(mids-self._region_size//2, mids+self._region_size//2, regions.directions[mask])
-        signals = new_regions.get_signals(bedgraph).scale_x(self._figure_width).update_dense_diffs(self._diffs, rows[mask])
-        # bedgraph.extract_regions(new_regions)
-        rows, counts = np.unique(rows[mask], return_counts=True)
+        if self._window_scale is None:
+            half_windows = self._region_size//2
+        else:
+            # Extract each row bucket only as wide as its largest domain needs
+            half_windows = np.maximum(np.ceil(self._window_scale*self._get_row_edges()[rows+1]).astype(mids.dtype)//2, 1)
+        new_regions = Regions(mids-half_windows, mids+half_windows, regions.directions[mask])
+        new_regions.get_signals(bedgraph).scale_x(self._figure_width).update_dense_diffs(self._diffs, rows)
+        rows, counts = np.unique(rows, return_counts=True)
         self._row_counts[rows] += counts
 
-    def _finalize(self):
-        values = np.cumsum(self._diffs, axis=-1)/np.maximum(self._row_counts, 1)[:, None]
+    def _interpolate_rows(self, values):
         marked_indices = np.flatnonzero(self._row_counts)
-        for pre, post in zip(marked_indices[:-1], marked_indices[1:]):
-            D = post-pre
-            if D==1:
-                continue
-            values[pre:post] = ((D-np.arange(D))[:, None]*values[pre]+np.arange(D)[:, None]*values[post])/D
-        
+        if marked_indices.size < 2:
+            return values
+        rows = np.arange(marked_indices[0], marked_indices[-1])
+        pre_idxs = np.searchsorted(marked_indices, rows, side="right")-1
+        pre = marked_indices[pre_idxs]
+        D = marked_indices[pre_idxs+1]-pre
+        gaps = D > 1
+        rows, pre, D = (rows[gaps], pre[gaps], D[gaps])
+        k = rows-pre
+        values[rows] = ((D-k)[:, None]*values[pre]+k[:, None]*values[pre+D])/D[:, None]
+        return values
+
+    def _finalize(self):
+        values = np.cumsum(self._diffs, axis=-1)/np.maximum(self._row_counts, 1).astype(self._dtype)[:, None]
+        values = self._interpolate_rows(values)
         if self._do_normalize:
             values/=(self._coverage/1000000)
         table = pd.DataFrame(values)
@@ -105,8 +207,18 @@ class VPlot(MatrixPlot):
 class HeatPlot(MatrixPlot):
     _aspect_ratio=2
     _region_size=100000
+    _n_features=20
     xlabel="Distance from center"
     ylabel="Rank(domainsize)"
+    sort_options = ("size", "mean", "max", "center", "kmeans")
+
+    def __init__(self, *args, sort_by="size", n_clusters=5, **kwargs):
+        super().__init__(*args, **kwargs)
+        assert sort_by in self.sort_options, sort_by
+        self._sort_by = sort_by
+        self._n_clusters = n_clusters
+        if sort_by != "size":
+            self.ylabel = f"Rank({sort_by})"
 
     def get_y_axis(self):
         return np.cumsum(self._row_counts)
@@ -119,34 +231,99 @@ class HeatPlot(MatrixPlot):
         return {chrom: y_coords[offsets[i]:offsets[i+1]] for i, chrom in enumerate(regions)}
 
     def _pre_process(self, bedgraphs, regions):
-        self._y_coords = self._get_y_coords(regions)
+        if self._sort_by == "size":
+            self._y_coords = self._get_y_coords(regions)
+        else:
+            self._signals = []
+            self._scores = []
+
+    def _flatten_state(self, genome):
+        if self._sort_by == "size":
+            self._y_coords = {genome.name: genome.flatten_values(self._y_coords)}
 
     def _transform_regions(self, regions):
         mids = (regions.ends+regions.starts)//2
         return Regions(mids-self._region_size//2, mids+self._region_size//2, regions.directions)
 
+    def _get_scores(self, signals):
+        if self._sort_by == "mean":
+            return signals.row_sums()/self._figure_width
+        if self._sort_by == "max":
+            return signals.row_max()
+        if self._sort_by == "center":
+            return signals.get_column(self._figure_width//2)
+        return signals.scale_x(self._n_features).to_dense()
+
     def _update_chromosome(self, chrom, bedgraph, regions):
-        y_coords = self._y_coords[chrom]
-        #signals = bedgraph.extract_regions(regions)
-        signals = regions.get_signals(bedgraph)
-        signals.scale_x(self._figure_width).update_dense_diffs(self._diffs, y_coords)
+        signals = regions.get_signals(bedgraph).scale_x(self._figure_width)
+        if self._sort_by != "size":
+            self._signals.append(signals)
+            self._scores.append(self._get_scores(signals))
+            return
+        # Regions may come in batches, so consume the row coordinates in order
+        y_coords, self._y_coords[chrom] = (self._y_coords[chrom][:len(regions)], self._y_coords[chrom][len(regions):])
+        signals.update_dense_diffs(self._diffs, y_coords)
         rows, counts = np.unique(y_coords, return_counts=True)
         self._row_counts[rows] += counts
 
+    def _get_order(self, scores):
+        if self._sort_by != "kmeans":
+            return get_ranks(scores)
+        labels, centers = kmeans(scores, self._n_clusters)
+        self._cluster_labels = labels
+        cluster_ranks = get_ranks(centers.mean(axis=-1))
+        order = np.lexsort((scores.mean(axis=-1), cluster_ranks[labels]))
+        return np.argsort(order)
+
+    def _finalize(self):
+        if self._sort_by != "size" and self._signals:
+            signals = BedGraphArray.vstack(self._signals)
+            ranks = self._get_order(np.concatenate(self._scores))
+            y_coords = (ranks*self._figure_shape[0])//ranks.size
+            signals.update_dense_diffs(self._diffs, y_coords)
+            rows, counts = np.unique(y_coords, return_counts=True)
+            self._row_counts[rows] += counts
+        return super()._finalize()
+
 class SignalPlot(AggregatePlot):
     xlabel="Fraction of region"
     ylabel="~FPKM"
+    def __init__(self, *args, n_bootstrap=0, confidence=0.95, seed=0, keep_rows=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._n_bootstrap = n_bootstrap
+        self._confidence = confidence
+        self._seed = seed
+        self._keep_rows = keep_rows
+        self._rows = []
+
     def _update_chromosome(self, chrom, bedgraph, regions):
         signals = regions.get_signals(bedgraph).scale_x(self._figure_width)
         # signals = bedgraph.extract_regions(regions)
-        signals.sum(axis=1).update_dense_diffs(self._diffs)
+        signals.sum(axis=1, dtype=self._dtype).update_dense_diffs(self._diffs)
         self._row_counts += regions.starts.size
+        if self._n_bootstrap or self._keep_rows:
+            self._rows.append(signals.to_dense(self._dtype))
+
+    def _get_bootstrap_means(self, rows, batch_size=100):
+        rng = np.random.default_rng(self._seed)
+        n = rows.shape[0]
+        means = []
+        for start in range(0, self._n_bootstrap, batch_size):
+            size = min(batch_size, self._n_bootstrap-start)
+            counts = rng.multinomial(n, np.full(n, 1/n), size=size)
+            means.append(counts @ rows/n)
+        return np.vstack(means)
 
     def _finalize(self):
         values = np.cumsum(self._diffs, axis=-1)/np.maximum(self._row_counts, 1)
-        if self._do_normalize:
-            values/=(self._coverage/1000000)
-        return pd.DataFrame({"x":self.get_x_axis(), "y": values})
+        scale = self._coverage/1000000 if self._do_normalize else 1
+        values/=scale
+        table = pd.DataFrame({"x":self.get_x_axis(), "y": values})
+        if self._n_bootstrap and self._rows:
+            means = self._get_bootstrap_means(np.vstack(self._rows))
+            alpha = (1-self._confidence)/2
+            table["lower"], table["upper"] = np.quantile(means, [alpha, 1-alpha], axis=0)/scale
+        return table
 
     def get_x_axis(self):
         return np.linspace(-0.5, 0.5, self._figure_width)
@@ -196,7 +373,7 @@ class MetaGenePlot(SignalPlot):
             [np.zeros_like(regions._coding_regions.starts),
              regions._coding_regions.starts,
              regions._coding_regions.ends,
-             regions.sizes()], self._region_sizes).sum(axis=1).update_dense_diffs(self._diffs)
+             regions.sizes()], self._region_sizes).sum(axis=1, dtype=self._dtype).update_dense_diffs(self._diffs)
         # 
         #     
         # 
@@ -206,3 +383,101 @@ class MetaGenePlot(SignalPlot):
         #     print(signals)
         #     signals.scale_x(diffs.shape[-1]).sum(axis=1).update_dense_diffs(diffs)
         # self._row_counts += regions.starts.size
+
+def _shift_strand(regions, offset, sense):
+    shift = np.where(regions.directions == (-1 if sense else 1), offset, 0)
+    return Regions(regions.starts+shift, regions.ends+shift, regions.directions)
+
+class StrandedPlot:
+    """Sense and antisense profiles from a (plus, minus) track pair in one pass
+
+    Each chromosome's minus track is laid out after the plus track, separated by zero padding,
+    and regions are shifted onto the sense or antisense strand by their direction"""
+    def __init__(self, plot_class, *args, **kwargs):
+        self.sense = plot_class(*args, **kwargs)
+        self.antisense = plot_class(*args, **kwargs)
+
+    def __call__(self, plus_bedgraphs, minus_bedgraphs, regions):
+        plots = (self.sense, self.antisense)
+        for plot in plots:
+            plot._start(plus_bedgraphs, regions)
+        padding = max(plot._get_padding(regions) for plot in plots)
+        for chrom, (plus, minus) in zip_bedgraphs(plus_bedgraphs, minus_bedgraphs):
+            if plus._size != minus._size:
+                raise ValueError("Plus and minus tracks differ in size on %s: %s, %s" % (chrom, plus._size, minus._size))
+            gap = BedGraph(np.zeros(1, dtype=plus._indices.dtype), np.zeros(1, dtype=plus._values.dtype), padding)
+            bedgraph = BedGraph.concatenate([plus, gap, minus])
+            for plot, sense in zip(plots, (True, False)):
+                chrom_regions = _shift_strand(regions[chrom], plus._size+padding, sense) if chrom in regions else None
+                plot._update(chrom, bedgraph, chrom_regions)
+        return self.sense._finalize(), self.antisense._finalize()
+
+class DifferentialPlot:
+    """Treatment vs control profiles for a SignalPlot class, with per-bin p-values for the difference
+
+    Both tracks are read in one pass. Each chromosome's region rows are folded into running sums for
+    every resample and then dropped, using sign-flip permutations of the per-region differences, or a
+    Poisson bootstrap of the regions"""
+    def __init__(self, plot_class, *args, n_resamples=1000, method="permutation", pseudocount=1, seed=0, **kwargs):
+        assert issubclass(plot_class, SignalPlot) and not issubclass(plot_class, MetaGenePlot), plot_class
+        assert method in ("permutation", "bootstrap"), method
+        self.treatment = plot_class(*args, keep_rows=True, **kwargs)
+        self.control = plot_class(*args, keep_rows=True, **kwargs)
+        self._n_resamples = n_resamples
+        self._method = method
+        self._pseudocount = pseudocount
+        self._seed = seed
+
+    def __call__(self, treatment_bedgraphs, control_bedgraphs, regions):
+        plots = (self.treatment, self.control)
+        for plot in plots:
+            plot._start(treatment_bedgraphs, regions)
+        self._rng = np.random.default_rng(self._seed)
+        self._sums = np.zeros((2, self.treatment._figure_width))
+        self._resampled_sums = np.zeros((2, self._n_resamples, self.treatment._figure_width))
+        for chrom, bedgraphs in zip_bedgraphs(treatment_bedgraphs, control_bedgraphs):
+            for plot, bedgraph in zip(plots, bedgraphs):
+                plot._update(chrom, bedgraph, regions[chrom] if chrom in regions else None)
+            self._update_sums()
+        return self._finalize()
+
+    def _update_sums(self, batch_size=100):
+        plots = (self.treatment, self.control)
+        if not self.treatment._rows:
+            return
+        rows = [np.vstack(plot._rows) for plot in plots]
+        for plot in plots:
+            plot._rows = []
+        n = rows[0].shape[0]
+        for i, r in enumerate(rows):
+            self._sums[i] += r.sum(axis=0)
+        for start in range(0, self._n_resamples, batch_size):
+            size = min(batch_size, self._n_resamples-start)
+            if self._method == "permutation":
+                weights = self._rng.choice(np.array([-1, 1], dtype=rows[0].dtype), size=(size, n))
+            else:
+                weights = self._rng.poisson(1, size=(size, n)).astype(rows[0].dtype)
+            for i, r in enumerate(rows):
+                self._resampled_sums[i, start:start+size] += weights @ r
+
+    def _get_scaled_diffs(self, sums):
+        scales = [plot._coverage/1000000 if plot._do_normalize else 1 for plot in (self.treatment, self.control)]
+        return sums[0]/scales[0]-sums[1]/scales[1]
+
+    def get_pvalues(self):
+        observed = self._get_scaled_diffs(self._sums)
+        resampled = self._get_scaled_diffs(self._resampled_sums)
+        if self._method == "permutation":
+            extreme = np.sum(np.abs(resampled) >= np.abs(observed), axis=0)
+            return (extreme+1)/(self._n_resamples+1)
+        below, above = (np.sum(resampled <= 0, axis=0), np.sum(resampled >= 0, axis=0))
+        return np.minimum(2*np.minimum(below, above)/self._n_resamples, 1)
+
+    def _finalize(self):
+        treatment_means, control_means = (self.treatment._finalize()["y"].values, self.control._finalize()["y"].values)
+        return pd.DataFrame({"x": self.treatment.get_x_axis(),
+                             "y": treatment_means-control_means,
+                             "treatment": treatment_means,
+                             "control": control_means,
+                             "log2ratio": np.log2((treatment_means+self._pseudocount)/(control_means+self._pseudocount)),
+                             "pvalue": self.get_pvalues()})
@@ -4,6 +4,7 @@ from collections import Counter
 from itertools import chain
 from more_itertools import pairwise
 from .regions import Regions
+from . import kernels
 
 def broadcast(values, offsets):
     broadcasted = np.zeros(offsets[-1], dtype=values.dtype)
@@ -11,11 +12,15 @@ def broadcast(values, offsets):
     broadcasted[0] = values[0]
     return np.cumsum(broadcasted)
 
+def _scale_indices(indices, size, old_sizes):
+    # Multiply in int64 so that int32 indices don't overflow
+    return (indices.astype(np.int64)*size//old_sizes).astype(indices.dtype)
+
 class BedGraph:
     def __init__(self, indices, values, size=None, strict=True):
         self._indices = np.asanyarray(indices)
         assert np.issubdtype(self._indices.dtype, np.integer), self._indices
-        if size is not None:
+        if size is not None and strict:
             assert np.all(self._indices<size), (self._indices, size)
 
         self._values = np.asanyarray(values)
@@ -23,6 +28,12 @@ class BedGraph:
             self._size = int(size)
         else:
             self._size = None
+        self._cumulative_areas = None
+        self._cumulative_coverage = None
+
+    @property
+    def nbytes(self):
+        return self._indices.nbytes + self._values.nbytes
 
     def __iter__(self):
         pairs = zip(self._indices, chain(self._indices[1:], [self._size]))
@@ -47,10 +58,8 @@ class BedGraph:
         return self.sum()/self._size
 
     def hist(self):
-        h = np.zeros(int(np.max(self._values))+1)
-        for (start, end), value in self:
-            h[int(value)]+=(end-start)
-        return h
+        sizes = np.diff(self._indices, append=self._get_end_index())
+        return np.bincount(self._values.astype(int), weights=sizes)
 
     def reverse(self):
         assert self._size is not None
@@ -75,6 +84,8 @@ class BedGraph:
         start_idxs = np.searchsorted(self._indices, starts, side="right")-1
         end_idxs = np.searchsorted(self._indices, ends, side="left")
         offsets = np.insert(np.cumsum(end_idxs-start_idxs), 0, 0)
+        if kernels.enabled:
+            return self._extract_regions_jit(regions, start_idxs, offsets)
         slice_indexes=self._get_slice_indexes(start_idxs, end_idxs, directions, offsets)
         values = self._values[slice_indexes]
         all_directions = broadcast(directions, offsets)
@@ -88,12 +99,58 @@ class BedGraph:
         # assert np.all(np.diff(transformed_indices)), (transformed_indices, regions)
         return BedGraphArray(transformed_indices, values, ends-starts, offsets)
 
+    def _extract_regions_jit(self, regions, start_idxs, offsets):
+        indices = np.empty(offsets[-1], dtype=np.result_type(self._indices, regions.starts))
+        values = np.empty(offsets[-1], dtype=self._values.dtype)
+        kernels.extract_regions(self._indices, self._values, self._size, regions.starts, regions.ends,
+                                regions.directions, start_idxs, offsets, indices, values)
+        return BedGraphArray(indices, values, regions.ends-regions.starts, offsets)
+
+    def _get_runs(self, mask):
+        padded = np.concatenate(([False], mask, [False]))
+        changes = np.flatnonzero(padded[1:] != padded[:-1])
+        return changes[::2], changes[1::2]
+
+    def _get_end_index(self):
+        if self._size is not None:
+            return self._size
+        return self._indices[-1]
+
+    def _get_cumulative_areas(self):
+        if self._cumulative_areas is None:
+            sizes = np.diff(self._indices, append=self._get_end_index())
+            self._cumulative_areas = np.insert(np.cumsum(sizes*self._values, dtype="float64"), 0, 0)
+        return self._cumulative_areas
+
+    def _get_cumulative_coverage(self):
+        if self._cumulative_coverage is None:
+            sizes = np.diff(self._indices, append=self._get_end_index())
+            self._cumulative_coverage = np.insert(np.cumsum(sizes*(self._values > 0)), 0, 0)
+        return self._cumulative_coverage
+
+    def _interpolate(self, cumulative, values, positions):
+        idxs = np.searchsorted(self._indices, positions, side="right")-1
+        return cumulative[idxs] + (positions-self._indices[idxs])*values[idxs]
+
+    def _get_areas(self, positions):
+        return self._interpolate(self._get_cumulative_areas(), self._values, positions)
+
+    def range_sums(self, starts, ends):
+        return self._get_areas(ends)-self._get_areas(starts)
+
+    def range_coverage(self, starts, ends):
+        cumulative, covered = (self._get_cumulative_coverage(), self._values > 0)
+        return self._interpolate(cumulative, covered, ends)-self._interpolate(cumulative, covered, starts)
+
+    def region_means(self, regions):
+        return self.range_sums(regions.starts, regions.ends)/regions.sizes()
+
     def threshold(self, value):
-        over = self._values >= value
-        changes = np.flatnonzero(over[1:] != over[:-1])
-        starts = self._indices[changes[::2]+1]
-        ends = self._indices[changes[1::2]+1]
-        return Regions(starts, ends)
+        start_idxs, end_idxs = self._get_runs(self._values >= value)
+        indices = np.append(self._indices, self._get_end_index())
+        starts, ends = (indices[start_idxs], indices[end_idxs])
+        mask = ends > starts
+        return Regions(starts[mask], ends[mask])
 
     def _getslice(self, slice_obj):
         assert slice_obj.step is None or slice_obj.step in (1, -1), slice_obj
@@ -121,7 +178,7 @@ class BedGraph:
 
     def scale_x(self, size):
         assert np.issubdtype(self._indices.dtype, np.integer), self._indices
-        new_indices = (self._indices*size//self._size)
+        new_indices = _scale_indices(self._indices, size, self._size)
         assert np.issubdtype(new_indices.dtype, np.integer), (self._indices, size, self._size)
         ds = np.concatenate((np.diff(new_indices)>0, [True]))
         return BedGraph(new_indices[ds], self._values[ds], size)
@@ -179,18 +236,29 @@ class BedGraphArray:
 
     def scale_x(self, size):
         assert size > 0 
+        if kernels.enabled:
+            return self._scale_x_jit(size)
         all_sizes=broadcast(self._sizes, self._offsets)
-        new_indices = (self._indices*size//all_sizes)
+        new_indices = _scale_indices(self._indices, size, all_sizes)
         mask = np.concatenate((np.diff(new_indices)>0, [True]))
         mask[self._offsets[1:]-1] = True
         counts = np.cumsum(mask)
         new_offsets = np.insert(counts[self._offsets[1:]-1], 0, 0)
         return BedGraphArray(new_indices[mask], self._values[mask], size*np.ones_like(self._sizes), new_offsets)
 
+    def _scale_x_jit(self, size):
+        indices = np.empty_like(self._indices)
+        values = np.empty_like(self._values)
+        offsets = np.zeros_like(self._offsets)
+        n = kernels.scale_x(self._indices, self._values, self._sizes, self._offsets, size, indices, values, offsets)
+        return BedGraphArray(indices[:n], values[:n], size*np.ones_like(self._sizes), offsets)
+
     def update_dense_diffs(self, diffs, rows):
         assert rows.size == self._offsets.size-1, (rows.size, self._offsets.size-1)
+        if kernels.enabled:
+            return kernels.update_dense_diffs(self._indices, self._values, self._offsets, rows, diffs)
         ncols = diffs.shape[1]
-        all_rows = broadcast(rows, self._offsets)
+        all_rows = broadcast(rows.astype(np.int64), self._offsets)
         composite_indexes = all_rows*ncols + self._indices
         args = np.argsort(composite_indexes, kind="mergesort")
         indices = composite_indexes[args]
@@ -198,22 +266,65 @@ class BedGraphArray:
         value_diffs = np.insert(np.diff(self._values), 0, self._values[0])
         value_diffs[self._offsets[:-1]] = self._values[self._offsets[:-1]]
         value_diffs = value_diffs[args]
-        totals = np.insert(np.cumsum(value_diffs)[index_changes], 0, 0)
+        totals = np.insert(np.cumsum(value_diffs, dtype=diffs.dtype)[index_changes], 0, 0)
         total_diffs = np.diff(totals)
         used_indices = indices[index_changes]
         diffs[used_indices//ncols, used_indices % ncols] += total_diffs
 
-    def _col_sum(self):
+    def _get_run_lengths(self):
+        ends = np.append(self._indices[1:], 0)
+        ends[self._offsets[1:]-1] = self._sizes
+        return ends-self._indices
+
+    def row_sums(self):
+        return np.add.reduceat(self._get_run_lengths()*self._values, self._offsets[:-1])
+
+    def row_means(self):
+        return self.row_sums()/self._sizes
+
+    def row_max(self):
+        return np.maximum.reduceat(self._values, self._offsets[:-1])
+
+    def row_argmax(self):
+        """Start position of the first maximal run in each row"""
+        max_idxs = np.flatnonzero(self._values == broadcast(self.row_max(), self._offsets))
+        rows = np.searchsorted(self._offsets, max_idxs, side="right")-1
+        return self._indices[max_idxs[np.insert(rows[1:] != rows[:-1], 0, True)]]
+
+    def row_coverage(self, threshold=0):
+        return np.add.reduceat(self._get_run_lengths()*(self._values > threshold), self._offsets[:-1])
+
+    def get_column(self, col):
+        idxs = self._offsets[:-1]+np.add.reduceat(self._indices <= col, self._offsets[:-1])-1
+        return self._values[idxs]
+
+    def to_dense(self, dtype=None):
+        assert np.all(self._sizes==self._sizes[0]), self._sizes
+        diffs = np.zeros((self._sizes.size, self._sizes[0]), dtype=dtype or self._values.dtype)
+        self.update_dense_diffs(diffs, np.arange(self._sizes.size))
+        return np.cumsum(diffs, axis=1, out=diffs)
+
+    def _col_sum(self, dtype=None):
         assert np.all(self._sizes==self._sizes[0]), self._sizes
+        if kernels.enabled:
+            return self._col_sum_jit(dtype)
         args = np.argsort(self._indices, kind="mergesort")
         indices = self._indices[args]
         index_changes = np.insert(indices[:-1] != indices[1:], indices.size-1, True)
         value_diffs = np.insert(np.diff(self._values), 0, self._values[0])[args]
         value_diffs[:self._offsets.size-1] = self._values[self._offsets[:-1]]
-        values = np.cumsum(value_diffs)[index_changes]
+        values = np.cumsum(value_diffs, dtype=dtype)[index_changes]
         indices = indices[index_changes]
         return BedGraph(indices, values, size=self._sizes[0])
 
+    def _col_sum_jit(self, dtype=None):
+        # Accumulate in the dtype np.cumsum would promote to
+        diffs = np.zeros(self._sizes[0], dtype=np.cumsum(self._values[:1], dtype=dtype).dtype)
+        breaks = np.zeros(self._sizes[0], dtype=bool)
+        kernels.col_diffs(self._indices, self._values, self._offsets, diffs, breaks)
+        indices = np.flatnonzero(breaks).astype(self._indices.dtype)
+        return BedGraph(indices, np.cumsum(diffs, out=diffs)[indices], size=self._sizes[0])
+
     def join_rows(self, offsets):
         cum_sizes = np.insert(np.cumsum(self._sizes), 0, 0)
         new_starts = cum_sizes[:-1]-broadcast(cum_sizes[offsets[:-1]], offsets)
@@ -222,10 +333,14 @@ class BedGraphArray:
         new_offsets = self._offsets[offsets]
         return self.__class__(new_indices, self._values, new_sizes, new_offsets)
 
-    def sum(self, axis=None):
+    def sum(self, axis=None, dtype=None):
         assert axis in (1, None)
         if axis == 1:
-            return self._col_sum()
+            return self._col_sum(dtype)
+        return np.sum(self._get_run_lengths()*self._values, dtype=dtype)
+
+    def mean(self):
+        return self.sum()/np.sum(self._sizes)
 
     def extract_regions(self, regions):
         assert regions.starts.size == self._sizes.size
@@ -242,16 +357,35 @@ class BedGraphArray:
         assert np.all(indices.size > offsets[:-1]), (offsets, mask, regions, self[0])
         indices[offsets[:-1]] = 0
         values = self._values[mask]
-        print(mask, indices, values)
         return self.__class__(indices, values, regions.sizes(), offsets)
 
+    def __len__(self):
+        return self._sizes.size
+
     def __getitem__(self, idx):
-        assert idx<self._offsets.size-1
+        if isinstance(idx, (int, np.integer)):
+            return self._get_row(idx)
+        if isinstance(idx, slice) and idx.step in (None, 1):
+            start, stop, _ = idx.indices(len(self))
+            stop = max(start, stop)
+            s = slice(self._offsets[start], self._offsets[stop])
+            return self.__class__(self._indices[s], self._values[s], self._sizes[start:stop],
+                                  self._offsets[start:stop+1]-self._offsets[start])
+        rows = np.arange(len(self))[idx]
+        counts = np.diff(self._offsets)[rows]
+        offsets = np.insert(np.cumsum(counts), 0, 0)
+        src = np.arange(offsets[-1])+broadcast(self._offsets[rows]-offsets[:-1], offsets) if rows.size else offsets[:0]
+        return self.__class__(self._indices[src], self._values[src], self._sizes[rows], offsets)
+
+    def _get_row(self, idx):
+        if idx < 0:
+            idx += len(self)
+        assert 0 <= idx < len(self), idx
         s = slice(self._offsets[idx], self._offsets[idx+1])
-        return BedGraph(self._indices[s], self._values[s], self._sizes[idx])
+        return BedGraph(self._indices[s], self._values[s], self._sizes[idx], strict=False)
 
     def __iter__(self):
-        return (self[i] for i in range(self._sizes.size))
+        return (self._get_row(i) for i in range(self._sizes.size))
 
     @classmethod
     def vstack(cls, arrays):
@@ -260,7 +394,6 @@ class BedGraphArray:
         offset_list = [a._offsets[:-1]+o for a, o in zip(arrays, offset_offsets)]
         last_offset = arrays[-1]._offsets[-1]+offset_offsets[-1]
         new_offsets = np.concatenate(offset_list + [[last_offset]])
-        print(new_offsets)
         return cls(np.concatenate([a._indices for a in arrays]),
                    np.concatenate([a._values for a in arrays]),
                    np.concatenate([a._sizes for a in arrays]),
@@ -281,7 +414,7 @@ class BedGraphArray:
         for (all_starts, all_ends), ns, offset in zip(pairwise(broad_casted), new_sizes, new_offsets):
             mask = self._indices>=all_starts
             mask &= self._indices<all_ends
-            new_indices[mask] = (offset+(self._indices-all_starts)*ns//(all_ends-all_starts))[mask]
+            new_indices[mask] = (offset+_scale_indices(self._indices-all_starts, ns, all_ends-all_starts))[mask]
 
         mask = np.concatenate((np.diff(new_indices)>0, [True]))
         mask[self._offsets[1:]-1] = True
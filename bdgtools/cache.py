@@ -0,0 +1,71 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+def _file_fingerprint(path, hash_contents=False):
+    path = Path(path)
+    if not hash_contents:
+        stat = path.stat()
+        return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+@lru_cache(maxsize=None)
+def _code_fingerprint():
+    """Hash of the package sources, so that any code change invalidates cached results"""
+    h = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+class ResultCache:
+    def __init__(self, directory, max_size=1 << 30, hash_contents=False):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_size = max_size
+        self._hash_contents = hash_contents
+
+    def get_key(self, files, **options):
+        h = hashlib.sha256(_code_fingerprint().encode())
+        for path in files:
+            h.update(_file_fingerprint(path, self._hash_contents).encode())
+        h.update(repr(sorted(options.items())).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        entry = self._directory / key
+        try:
+            with open(entry / "table.pkl", "rb") as f:
+                table = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(entry)
+        return table
+
+    def put(self, key, table):
+        tmp = Path(tempfile.mkdtemp(dir=self._directory, prefix=".tmp"))
+        with open(tmp / "table.pkl", "wb") as f:
+            pickle.dump(table, f)
+        try:
+            tmp.rename(self._directory / key)
+        except OSError:
+            shutil.rmtree(tmp)
+        self._evict()
+
+    def _evict(self):
+        entries = [(entry.stat().st_mtime, sum(f.stat().st_size for f in entry.iterdir()), entry)
+                   for entry in self._directory.iterdir() if entry.is_dir() and not entry.name.startswith(".tmp")]
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self._max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
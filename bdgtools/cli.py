@@ -1,15 +1,46 @@
 """Console script for bdgtools."""
+import os
 import sys
 import click
 import gzip
 from pathlib import PurePath
 
-from .io import read_bedgraph, read_bedfile, read_refseq, read_large_bedfile, write_bedgraph
-from .aggregateplot import *
-from .coverage import get_coverage
-from .plotter import plot, join_plots
-plot_types = {"v": VPlot, "average": AveragePlot, "heat": HeatPlot, "tss": TSSPlot, "signal": SignalPlot,
-              "metagene": MetaGenePlot, "border": BorderPlot}
+from .plottypes import plot_types, get_plot_class
+
+# Heavy dependencies (pandas, matplotlib, seaborn) are imported inside the
+# commands that need them to keep startup fast for small jobs
+compact_dtypes = {"index_dtype": "int32", "value_dtype": "float32"}
+
+def show_plot(fig, f, out_im, out_data):
+    show = out_im is None and out_data is None
+    if out_im is None and not show:
+        return
+    from .plotter import plot
+    plot(fig, f, save_path=out_im, show=show)
+
+_uncached_params = ("out_im", "out_data", "prefetch_depth", "max_memory", "cache_dir", "cache_size")
+
+def cached_plot(f, compute, input_files, cache_dir, cache_size):
+    input_files = [getattr(path, "name", path) for path in input_files if path is not None]
+    # Streams like stdin can't be fingerprinted
+    if cache_dir is None or not all(isinstance(path, str) and os.path.isfile(path) for path in input_files):
+        return compute()
+    from .cache import ResultCache
+    params = {name: getattr(value, "name", value) for name, value in click.get_current_context().params.items()
+              if name not in _uncached_params}
+    cache = ResultCache(cache_dir, cache_size*2**20)
+    key = cache.get_key(input_files, plot=f.__class__.__name__, **params)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    fig = compute()
+    cache.put(key, fig)
+    return fig
+
+def cache_options(command):
+    command = click.option("--cache-dir", "cache_dir", type=click.Path(file_okay=False), envvar="BDGTOOLS_CACHE",
+                           help="Directory for cached plot results")(command)
+    return click.option("--cache-size", "cache_size", default=1024, help="Maximum cache size in MB")(command)
 
 @click.command()
 @click.argument("plot_type", type=click.Choice(plot_types.keys()))
@@ -19,12 +50,54 @@ plot_types = {"v": VPlot, "average": AveragePlot, "heat": HeatPlot, "tss": TSSPl
 @click.option("-od", "--out_data", "out_data", type=click.File("wb"), help="Path to pickle of figure")
 @click.option("-w", "--width", "figure_width", default=2000, help="Figure width")
 @click.option("-rs", "--regionsize", "region_size", type=int, help="Genomic region size")
-def do_plot(plot_type, bedgraph, bedfile, out_im, out_data, figure_width, region_size):
-    bedgraphs = read_bedgraph(bedgraph)
-    regions = read_bedfile(bedfile)
-    f = plot_types[plot_type](figure_width=figure_width, region_size=region_size)
-    fig = f(bedgraphs, regions)
-    plot(fig, f, save_path=out_im, show=out_im is None and out_data is None)
+@click.option("-c", "--compact", is_flag=True, help="Read coordinates as int32 and values as float32")
+@click.option("-p", "--precision", type=click.Choice(["float32", "float64"]), default="float64", help="Accumulation precision")
+@click.option("-s", "--sortby", "sort_by", type=click.Choice(["size", "mean", "max", "center", "kmeans"]),
+              default="size", help="Row ordering for heat plots")
+@click.option("-k", "--clusters", "n_clusters", default=5, help="Number of clusters for --sortby kmeans")
+@click.option("-pf", "--prefetch", "prefetch_depth", default=2, help="Number of chromosomes to parse ahead")
+@click.option("-g", "--chromsizes", "chromsizes", type=click.File("r"),
+              help="Chromosome sizes file. Process the whole genome in one flat coordinate space")
+@click.option("--sample", "sample", type=int, help="Plot a size-stratified sample of this many regions")
+@click.option("--fraction", "fraction", type=float, help="Plot a size-stratified sample of this fraction of regions")
+@click.option("--bootstrap", "n_bootstrap", default=200, help="Bootstrap replicates for confidence bands on sampled signal plots")
+@click.option("--seed", "seed", default=0, help="Random seed for sampling")
+@click.option("--sizebins", "size_bins", type=click.Choice(["linear", "log"]), default="linear",
+              help="Domain size binning for v plots")
+@click.option("--maxquantile", "max_quantile", type=float,
+              help="Cap the v plot domain size at this quantile instead of the largest domain")
+@click.option("--windowscale", "window_scale", type=float,
+              help="Extract v plot rows in windows this many times their domain size, with relative x axis")
+@click.option("-mm", "--maxmemory", "max_memory", type=int,
+              help="Extract regions in batches to keep extraction memory below this many MB")
+@cache_options
+def do_plot(plot_type, bedgraph, bedfile, out_im, out_data, figure_width, region_size, compact, precision,
+            sort_by, n_clusters, prefetch_depth, chromsizes, sample, fraction, n_bootstrap, seed,
+            size_bins, max_quantile, window_scale, max_memory, cache_dir, cache_size):
+    kwargs = {"sort_by": sort_by, "n_clusters": n_clusters} if plot_type == "heat" else {}
+    if plot_type == "v":
+        kwargs.update(size_bins=size_bins, max_quantile=max_quantile, window_scale=window_scale)
+    sampling = sample is not None or fraction is not None
+    if sampling and plot_type in ("average", "tss", "signal", "border"):
+        kwargs.update(n_bootstrap=n_bootstrap, seed=seed)
+    if max_memory is not None:
+        kwargs.update(max_memory=max_memory*2**20)
+    f = get_plot_class(plot_type)(figure_width=figure_width, region_size=region_size, dtype=precision, **kwargs)
+
+    def compute():
+        from .io import read_bedgraph, read_bedfile, read_chrom_sizes, prefetch
+        from .regions import sample_regions
+        dtypes = compact_dtypes if compact else {}
+        bedgraphs = prefetch(read_bedgraph(bedgraph, **dtypes), prefetch_depth)
+        regions = read_bedfile(bedfile, index_dtype=dtypes.get("index_dtype"))
+        if sampling:
+            regions = sample_regions(regions, sample, fraction, seed=seed)
+        if chromsizes is not None:
+            return f.call_flat(bedgraphs, regions, read_chrom_sizes(chromsizes))
+        return f(bedgraphs, regions)
+
+    fig = cached_plot(f, compute, [bedgraph, bedfile, chromsizes], cache_dir, cache_size)
+    show_plot(fig, f, out_im, out_data)
     if out_data is not None:
         fig.to_pickle(out_data)
     return 0
@@ -39,10 +112,12 @@ def main():
 @click.option("-o", "--out_im", "out_im", type=click.File("wb"))
 @click.option("-n", "--name", "name", default="")
 def joinfigs(plot_type, data_files, out_im, name):
+    import pandas as pd
+    from .plotter import join_plots
     figs = [pd.read_pickle(df) for df in data_files]
     names = [PurePath(df.name).stem for df in data_files]
     click.echo("Joining figures from %s" % " ".join(names))
-    cls = plot_types[plot_type]
+    cls = get_plot_class(plot_type)
     name = cls.__name__+ ":" + name
     join_plots(figs, names, cls, save_path=out_im, show=out_im is None, name=name)
 
@@ -55,12 +130,75 @@ def joinfigs(plot_type, data_files, out_im, name):
 @click.option("-od", "--out_data", "out_data", type=click.File("wb"), help="Path to pickle of figure")
 @click.option("-w", "--width", "figure_width", default=2000, help="Figure width")
 @click.option("-rs", "--regionsize", "region_size", type=int, help="Genomic region size")
-def geneplot(plot_type, bedgraph, genefile, out_im, out_data, figure_width, region_size):
-    bedgraphs = read_bedgraph(bedgraph)
-    regions = read_refseq(genefile)
-    f = plot_types[plot_type](figure_width=figure_width, region_size=region_size)
-    fig = f(bedgraphs, regions)
-    plot(fig, f, save_path=out_im, show=out_im is None and out_data is None)
+@click.option("-c", "--compact", is_flag=True, help="Read coordinates as int32 and values as float32")
+@click.option("-p", "--precision", type=click.Choice(["float32", "float64"]), default="float64", help="Accumulation precision")
+@click.option("-pf", "--prefetch", "prefetch_depth", default=2, help="Number of chromosomes to parse ahead")
+@cache_options
+def geneplot(plot_type, bedgraph, genefile, out_im, out_data, figure_width, region_size, compact, precision,
+             prefetch_depth, cache_dir, cache_size):
+    f = get_plot_class(plot_type)(figure_width=figure_width, region_size=region_size, dtype=precision)
+
+    def compute():
+        from .io import read_bedgraph, read_refseq, prefetch
+        bedgraphs = prefetch(read_bedgraph(bedgraph, **(compact_dtypes if compact else {})), prefetch_depth)
+        return f(bedgraphs, read_refseq(genefile))
+
+    fig = cached_plot(f, compute, [bedgraph, genefile], cache_dir, cache_size)
+    show_plot(fig, f, out_im, out_data)
+    if out_data is not None:
+        fig.to_pickle(out_data)
+    return 0
+
+@main.command()
+@click.argument("plot_type", type=click.Choice(plot_types.keys()))
+@click.argument("plus", type=click.Path())
+@click.argument("minus", type=click.Path())
+@click.argument("bedfile", type=click.File("r"))
+@click.option("-o", "--out_im", "out_im", type=click.Path(), help="Path to output figure, suffixed with _sense/_antisense")
+@click.option("-od", "--out_data", "out_data", type=click.Path(), help="Path to pickle of figure, suffixed with _sense/_antisense")
+@click.option("-w", "--width", "figure_width", default=2000, help="Figure width")
+@click.option("-rs", "--regionsize", "region_size", type=int, help="Genomic region size")
+@click.option("-c", "--compact", is_flag=True, help="Read coordinates as int32 and values as float32")
+@click.option("-p", "--precision", type=click.Choice(["float32", "float64"]), default="float64", help="Accumulation precision")
+def strandplot(plot_type, plus, minus, bedfile, out_im, out_data, figure_width, region_size, compact, precision):
+    from .io import read_bedgraph, read_bedfile
+    from .aggregateplot import StrandedPlot
+    dtypes = compact_dtypes if compact else {}
+    f = StrandedPlot(get_plot_class(plot_type), figure_width=figure_width, region_size=region_size, dtype=precision)
+    figs = f(read_bedgraph(plus, **dtypes), read_bedgraph(minus, **dtypes),
+             read_bedfile(bedfile, index_dtype=dtypes.get("index_dtype")))
+    for fig, plot_obj, strand in zip(figs, (f.sense, f.antisense), ("sense", "antisense")):
+        paths = [None if path is None else str(PurePath(path).with_name(
+            PurePath(path).stem + "_" + strand + PurePath(path).suffix)) for path in (out_im, out_data)]
+        show_plot(fig, plot_obj, *paths)
+        if paths[1] is not None:
+            fig.to_pickle(paths[1])
+    return 0
+
+@main.command()
+@click.argument("plot_type", type=click.Choice(["tss", "signal", "average", "border"]))
+@click.argument("treatment", type=click.Path())
+@click.argument("control", type=click.Path())
+@click.argument("bedfile", type=click.File("r"))
+@click.option("-o", "--out_im", "out_im", type=click.File("wb"), help="Path to output figure of the difference")
+@click.option("-od", "--out_data", "out_data", type=click.File("wb"), help="Path to pickle of the differential table")
+@click.option("-w", "--width", "figure_width", default=2000, help="Figure width")
+@click.option("-rs", "--regionsize", "region_size", type=int, help="Genomic region size")
+@click.option("-c", "--compact", is_flag=True, help="Read coordinates as int32 and values as float32")
+@click.option("-n", "--resamples", "n_resamples", default=1000, help="Number of permutations/bootstrap replicates")
+@click.option("-m", "--method", type=click.Choice(["permutation", "bootstrap"]), default="permutation",
+              help="Sign-flip permutations or Poisson bootstrap over regions")
+@click.option("--seed", "seed", default=0, help="Random seed for resampling")
+def diffplot(plot_type, treatment, control, bedfile, out_im, out_data, figure_width, region_size, compact,
+             n_resamples, method, seed):
+    from .io import read_bedgraph, read_bedfile
+    from .aggregateplot import DifferentialPlot
+    dtypes = compact_dtypes if compact else {}
+    f = DifferentialPlot(get_plot_class(plot_type), figure_width=figure_width, region_size=region_size,
+                         n_resamples=n_resamples, method=method, seed=seed)
+    fig = f(read_bedgraph(treatment, **dtypes), read_bedgraph(control, **dtypes),
+            read_bedfile(bedfile, index_dtype=dtypes.get("index_dtype")))
+    show_plot(fig, f.treatment, out_im, out_data)
     if out_data is not None:
         fig.to_pickle(out_data)
     return 0
@@ -68,10 +206,180 @@ def geneplot(plot_type, bedgraph, genefile, out_im, out_data, figure_width, regi
 @main.command()
 @click.argument("bedfile", type=click.Path())
 @click.option("-o", "--outfile", "outfile", type=click.File("w"), help="Path to bedgraph file")
-def bed2bdg(bedfile, outfile):
-    bedfile = read_large_bedfile(gzip.open(bedfile, "rt"))
-    bedgraphs = ((chrom, get_coverage(regions)) for chrom, regions in bedfile)
-    write_bedgraph(bedgraphs, outfile)
+@click.option("-pf", "--prefetch", "prefetch_depth", default=2, help="Number of chromosomes to parse ahead")
+@click.option("-f", "--format", "file_format", type=click.Choice(["bed", "bedpe", "pairedbed"]), default="bed",
+              help="Single reads, BEDPE fragments or BED with mates sharing a read name, in any order")
+@click.option("-d", "--dedup", is_flag=True, help="Remove duplicate reads/fragments with identical start, end and strand")
+@click.option("--min-size", "min_size", type=int, help="Minimum fragment size")
+@click.option("--max-size", "max_size", type=int, help="Maximum fragment size")
+@click.option("-b", "--binsize", "binsize", type=int, help="Write binned coverage as fixedStep wiggle")
+@click.option("-s", "--stat", "stat", type=click.Choice(["mean", "max", "count"]), default="mean",
+              help="Per bin mean or max coverage, or number of overlapping reads")
+@click.option("--cpm", is_flag=True, help="Scale binned values to counts per million reads")
+@click.option("-g", "--chromsizes", "chromsizes", type=click.File("r"), help="Chromosome sizes for the number of bins")
+def bed2bdg(bedfile, outfile, prefetch_depth, file_format, dedup, min_size, max_size, binsize, stat, cpm, chromsizes):
+    from .io import read_large_bedfile, read_fragments, write_bedgraph, write_fixed_step, read_chrom_sizes, prefetch
+    from .coverage import get_coverage, get_binned_coverage
+    if binsize is None and (cpm or chromsizes is not None):
+        raise click.UsageError("--cpm and --chromsizes require --binsize")
+    file_obj = gzip.open(bedfile, "rt")
+    if file_format == "bed":
+        bedfile = read_large_bedfile(file_obj)
+    else:
+        bedfile = read_fragments(file_obj, paired_bed=file_format == "pairedbed")
+    bedfile = prefetch(bedfile, prefetch_depth)
+    if dedup:
+        bedfile = ((chrom, regions.unique()) for chrom, regions in bedfile)
+    if min_size is not None or max_size is not None:
+        bedfile = ((chrom, regions.filter_sizes(min_size, max_size)) for chrom, regions in bedfile)
+    if binsize is None:
+        bedgraphs = ((chrom, get_coverage(regions)) for chrom, regions in bedfile if len(regions))
+        write_bedgraph(bedgraphs, outfile)
+        return 0
+    chrom_sizes = read_chrom_sizes(chromsizes) if chromsizes is not None else {}
+    sizes = ((chrom, regions, chrom_sizes.get(chrom, int(regions.ends.max()))) for chrom, regions in bedfile if len(regions))
+    binned = ((chrom, len(regions), size, get_binned_coverage(regions, binsize, stat, size))
+              for chrom, regions, size in sizes)
+    if cpm:
+        # The total read count is only known after the last chromosome, so keep the (small) binned tracks
+        binned = [(chrom, n_reads, size, values.astype("float32")) for chrom, n_reads, size, values in binned]
+        scale = 1000000/max(sum(n_reads for _, n_reads, _, _ in binned), 1)
+        binned = [(chrom, n_reads, size, values*scale) for chrom, n_reads, size, values in binned]
+    write_fixed_step(((chrom, size, values) for chrom, _, size, values in binned), binsize, outfile)
+    return 0
+
+@main.command()
+@click.argument("bedgraph", type=click.Path())
+@click.option("-t", "--threshold", "threshold", type=float, required=True, help="Minimum signal value in peaks")
+@click.option("-l", "--minlength", "min_length", default=0, help="Minimum peak length")
+@click.option("-g", "--maxgap", "max_gap", default=0, help="Merge peaks separated by at most this distance")
+@click.option("-bw", "--backgroundwindow", "background_window", type=int, help="Window size for local background")
+@click.option("-f", "--fold", "fold", default=1.0, help="Minimum fold over local background")
+@click.option("-o", "--outfile", "outfile", type=click.File("w"), default="-", help="Path to bedfile")
+def callpeaks(bedgraph, threshold, min_length, max_gap, background_window, fold, outfile):
+    from .io import read_bedgraph, write_bedfile
+    from .peakcalling import call_peaks
+    peaks = ((chrom, call_peaks(bg, threshold, min_length, max_gap, background_window, fold))
+             for chrom, bg in read_bedgraph(bedgraph))
+    write_bedfile(peaks, outfile)
+    return 0
+
+@main.command()
+@click.argument("plot_type", type=click.Choice(plot_types.keys()))
+@click.argument("data_files", nargs=-1, type=click.Path(exists=True))
+@click.option("-d", "--outdir", "outdir", type=click.Path(file_okay=False), default=".", help="Directory for figures")
+@click.option("-j", "--jobs", "jobs", type=int, help="Number of parallel processes")
+@click.option("--raw", is_flag=True, help="Write matrix plots directly as images without axes")
+def render(plot_type, data_files, outdir, jobs, raw):
+    from pathlib import Path
+    from .plotter import render_batch
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    save_paths = [str(Path(outdir) / (PurePath(data_file).stem + ".png")) for data_file in data_files]
+    for save_path in render_batch(data_files, get_plot_class(plot_type), save_paths, jobs, raw):
+        click.echo(save_path)
+    return 0
+
+@main.command()
+@click.argument("bedgraph", type=click.Path())
+@click.argument("bedfile", type=click.File("r"))
+@click.option("-o", "--outfile", "outfile", type=click.Path(), required=True, help="Path to .npy matrix")
+@click.option("-w", "--width", "width", default=100, help="Number of bins per region")
+@click.option("-rs", "--regionsize", "region_size", type=int, help="Genomic window size around region centers")
+@click.option("-c", "--compact", is_flag=True, help="Read coordinates as int32 and values as float32")
+def matrix(bedgraph, bedfile, outfile, width, region_size, compact):
+    from .io import read_bedgraph, read_bedfile
+    from .matrix import compute_matrix, get_region_table
+    dtypes = compact_dtypes if compact else {}
+    regions = read_bedfile(bedfile, index_dtype=dtypes.get("index_dtype"))
+    get_region_table(regions).to_csv(PurePath(outfile).with_suffix(".regions.tsv"), sep="\t", index=False)
+    compute_matrix(read_bedgraph(bedgraph, **dtypes), regions, outfile, width, region_size)
+    return 0
+
+@main.command()
+@click.argument("bedgraph", type=click.Path())
+@click.argument("bedfile", type=click.File("r"))
+@click.option("-o", "--outfile", "outfile", type=click.File("w"), default="-", help="Path to output table")
+def score(bedgraph, bedfile, outfile):
+    import numpy as np
+    from .io import read_bedgraph, read_bedfile, write_region_scores
+    regions = read_bedfile(bedfile)
+    scored = set()
+    def get_scores():
+        for chrom, bg in read_bedgraph(bedgraph):
+            if chrom not in regions:
+                continue
+            r = regions[chrom]
+            scored.add(chrom)
+            yield chrom, r, bg.range_sums(r.starts, r.ends), bg.range_coverage(r.starts, r.ends)
+        for chrom, r in regions.items():
+            if chrom not in scored:
+                yield chrom, r, np.zeros(len(r)), np.zeros(len(r), dtype="int")
+    write_region_scores(get_scores(), outfile)
+    return 0
+
+@main.command()
+@click.argument("method", type=click.Choice(["mean", "gaussian", "max"]))
+@click.argument("bedgraph", type=click.Path())
+@click.option("-w", "--width", "width", type=int, required=True, help="Window width (sigma for gaussian)")
+@click.option("-r", "--resolution", "resolution", default=10, help="Bin size of the smoothed track")
+@click.option("-o", "--outfile", "outfile", type=click.File("w"), default="-", help="Path to bedgraph file")
+@click.option("-pf", "--prefetch", "prefetch_depth", default=2, help="Number of chromosomes to parse ahead")
+def smooth(method, bedgraph, width, resolution, outfile, prefetch_depth):
+    from .io import read_bedgraph, write_bedgraph, prefetch
+    from .smoothing import smoothers
+    smoother = smoothers[method]
+    bedgraphs = prefetch(read_bedgraph(bedgraph), prefetch_depth)
+    write_bedgraph(((chrom, smoother(bg, width, resolution)) for chrom, bg in bedgraphs), outfile)
+    return 0
+
+@main.command()
+@click.argument("bedgraphs", nargs=-1, type=click.Path(exists=True))
+@click.option("-b", "--binsize", "binsize", type=int, help="Correlate binned means instead of base-pair runs")
+@click.option("-o", "--outfile", "outfile", type=click.File("w"), default="-", help="Path to correlation table")
+@click.option("-f", "--fingerprint", "fingerprint", type=click.File("w"), help="Path to fingerprint table")
+@click.option("--spearman", is_flag=True,
+              help="Also write the Spearman correlation of the bins. Exact ranks keep every bin of every track in memory")
+def qc(bedgraphs, binsize, outfile, fingerprint, spearman):
+    from .io import read_bedgraph, zip_bedgraphs
+    from .qc import TrackQC
+    if spearman and binsize is None:
+        raise click.UsageError("--spearman requires --binsize")
+    names = [PurePath(bedgraph).stem for bedgraph in bedgraphs]
+    track_qc = TrackQC(names, binsize, keep_bins=spearman)
+    for chrom, tracks in zip_bedgraphs(*(read_bedgraph(bedgraph) for bedgraph in bedgraphs)):
+        track_qc.update(chrom, tracks)
+    outfile.write("# Pearson\n")
+    track_qc.pearson().to_csv(outfile, sep="\t")
+    if spearman:
+        outfile.write("# Spearman\n")
+        track_qc.spearman().to_csv(outfile, sep="\t")
+    if fingerprint is not None:
+        track_qc.fingerprints().to_csv(fingerprint, sep="\t", index=False)
+    return 0
+
+@main.command()
+@click.argument("bedgraphs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", default=8765, help="Port to listen on")
+@click.option("-j", "--workers", default=4, help="Number of concurrent plot workers")
+@click.option("-m", "--memory", default=4096, help="Memory budget for resident tracks in MB")
+@click.option("--mmap", "mmap_dir", type=click.Path(file_okay=False), help="Directory for memory-mapped track arrays")
+@click.option("-c", "--compact", is_flag=True, help="Read coordinates as int32 and values as float32")
+@click.option("-z", "--compress", is_flag=True, help="Keep tracks delta/dictionary encoded in memory")
+@click.option("-d", "--data-dir", "data_dir", type=click.Path(exists=True, file_okay=False),
+              help="Directory that region files in plot requests are read from")
+def serve(bedgraphs, host, port, workers, memory, mmap_dir, compact, compress, data_dir):
+    from .server import TrackStore, make_server
+    store = TrackStore(bedgraphs, memory*2**20, mmap_dir, compact_dtypes if compact else {}, compress)
+    server = make_server(store, host, port, workers, data_dir)
+    click.echo("Serving %s tracks on http://%s:%s" % (len(bedgraphs), *server.server_address[:2]), err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown()
     return 0
 
 
@@ -0,0 +1,90 @@
+import numpy as np
+from .bedgraph import BedGraph
+
+_delta_dtypes = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+def _ranges(starts, lengths):
+    """Concatenation of arange(start, start+length) for each pair"""
+    offsets = np.insert(np.cumsum(lengths), 0, 0)
+    return np.arange(offsets[-1]) + np.repeat(starts-offsets[:-1], lengths)
+
+def _encode_values(values, max_levels, quantize):
+    levels, codes = np.unique(values, return_inverse=True)
+    if levels.size > max_levels:
+        if not quantize:
+            return values, None
+        lo, hi = (values.min(), values.max())
+        codes = np.rint((values-lo)/(hi-lo)*(max_levels-1))
+        levels = lo + np.arange(max_levels)*(hi-lo)/(max_levels-1)
+        levels = levels.astype(values.dtype)
+    return codes.astype(np.min_scalar_type(max(levels.size-1, 0))), levels
+
+class CompressedBedGraph:
+    """Read-only BedGraph with block-wise delta encoded indices and dictionary/quantized values"""
+    def __init__(self, bedgraph, block_size=1024, max_levels=65536, quantize=False):
+        indices = bedgraph._indices
+        self._size = bedgraph._size
+        self._n = indices.size
+        self._block_size = block_size
+        self._index_dtype = indices.dtype
+        self._block_starts = indices[::block_size].astype(np.int64)
+        deltas = np.diff(indices.astype(np.int64), prepend=0)
+        deltas[::block_size] = 0
+        lengths = self._get_block_lengths(np.arange(self._block_starts.size))
+        block_max = np.maximum.reduceat(deltas, np.arange(0, self._n, block_size))
+        self._widths = np.searchsorted([np.iinfo(t).max for t in _delta_dtypes], block_max).astype(np.uint8)
+        self._pool_offsets = np.zeros(self._widths.size, dtype=np.int64)
+        self._pools = []
+        for width, dtype in enumerate(_delta_dtypes):
+            blocks = np.flatnonzero(self._widths == width)
+            self._pool_offsets[blocks] = np.insert(np.cumsum(lengths[blocks]), 0, 0)[:-1]
+            self._pools.append(deltas[_ranges(blocks*block_size, lengths[blocks])].astype(dtype))
+        self._codes, self._levels = _encode_values(bedgraph._values, max_levels, quantize)
+        self._sum = self._decode_blocks(np.arange(self._widths.size)).sum()
+
+    @property
+    def nbytes(self):
+        arrays = [self._block_starts, self._widths, self._pool_offsets, self._codes] + self._pools
+        if self._levels is not None:
+            arrays.append(self._levels)
+        return sum(a.nbytes for a in arrays)
+
+    def _get_block_lengths(self, blocks):
+        return np.minimum(self._block_size, self._n-blocks*self._block_size)
+
+    def _decode_blocks(self, blocks):
+        lengths = self._get_block_lengths(blocks)
+        offsets = np.insert(np.cumsum(lengths), 0, 0)
+        deltas = np.zeros(offsets[-1], dtype=np.int64)
+        for width, pool in enumerate(self._pools):
+            mask = self._widths[blocks] == width
+            deltas[_ranges(offsets[:-1][mask], lengths[mask])] = pool[_ranges(self._pool_offsets[blocks[mask]], lengths[mask])]
+        indices = np.cumsum(deltas)
+        indices += np.repeat(self._block_starts[blocks]-indices[offsets[:-1]], lengths)
+        value_idxs = _ranges(blocks*self._block_size, lengths)
+        values = self._codes[value_idxs] if self._levels is None else self._levels[self._codes[value_idxs]]
+        return BedGraph(indices.astype(self._index_dtype), values, self._size, strict=False)
+
+    def _get_blocks(self, starts, ends):
+        """Blocks holding the runs overlapping [starts, ends), plus the block after for the run ends"""
+        first = np.searchsorted(self._block_starts, starts, side="right")-1
+        last = np.minimum(np.searchsorted(self._block_starts, ends, side="left"), self._widths.size-1)
+        counts = np.zeros(self._widths.size+1, dtype=np.int64)
+        np.add.at(counts, np.maximum(first, 0), 1)
+        np.add.at(counts, last+1, -1)
+        return np.flatnonzero(np.cumsum(counts[:-1]) > 0)
+
+    def to_bedgraph(self):
+        return self._decode_blocks(np.arange(self._widths.size))
+
+    def sum(self):
+        return self._sum
+
+    def extract_regions(self, regions):
+        return self._decode_blocks(self._get_blocks(regions.starts, regions.ends)).extract_regions(regions)
+
+    def __getitem__(self, index):
+        assert isinstance(index, slice), index
+        start = index.start or 0
+        stop = self._size if index.stop is None else index.stop
+        return self._decode_blocks(self._get_blocks([start], [stop]))[index]
@@ -1,8 +1,11 @@
 from .bedgraph import BedGraph
+from . import kernels
 import numpy as np
 
 
 def get_coverage(regions):
+    if kernels.enabled:
+        return _get_coverage_jit(regions)
     all_indices = np.concatenate((regions.starts, regions.ends))
     args = np.argsort(all_indices, kind="mergesort")
     diffs = np.where(args<regions.starts.size, 1, -1)
@@ -18,4 +21,44 @@ def get_coverage(regions):
         values = np.insert(values, 0, 0)
     
     return BedGraph(indices, values)
-                    
+
+def _get_coverage_jit(regions):
+    n = 2*regions.starts.size
+    indices = np.empty(n, dtype=np.result_type(regions.starts, regions.ends))
+    values = np.empty(n, dtype=np.int64)
+    k = kernels.coverage(np.sort(regions.starts), np.sort(regions.ends), indices, values)
+    indices, values = indices[:k], values[:k]
+    if indices[0] != 0:
+        indices = np.insert(indices, 0, 0)
+        values = np.insert(values, 0, 0)
+    return BedGraph(indices, values)
+
+def _get_depths(sorted_starts, sorted_ends, positions):
+    return np.searchsorted(sorted_starts, positions, side="right")-np.searchsorted(sorted_ends, positions, side="right")
+
+def get_binned_coverage(regions, binsize, stat="mean", size=None):
+    """Mean/max coverage or number of overlapping regions per bin, without building the base-pair coverage"""
+    starts, ends = (regions.starts.astype(np.int64), regions.ends.astype(np.int64))
+    if size is None:
+        size = int(ends.max(initial=0))
+    n_bins = -(-size//binsize)
+    mask = starts < size
+    starts, ends = (starts[mask], np.minimum(ends[mask], size))
+    first, last = (starts//binsize, (ends-1)//binsize)
+    if stat == "count":
+        return np.cumsum(np.bincount(first, minlength=n_bins+1)-np.bincount(last+1, minlength=n_bins+1))[:n_bins]
+    if stat == "max":
+        sorted_starts, sorted_ends = (np.sort(starts), np.sort(ends))
+        # Coverage only increases at region starts, so the max is at the bin start or at a start inside the bin
+        maxes = _get_depths(sorted_starts, sorted_ends, np.arange(n_bins)*binsize)
+        np.maximum.at(maxes, sorted_starts//binsize, _get_depths(sorted_starts, sorted_ends, sorted_starts))
+        return maxes
+    assert stat == "mean", stat
+    single = first == last
+    areas = np.bincount(first, weights=np.where(single, ends, (first+1)*binsize)-starts, minlength=n_bins+1)
+    areas += np.bincount(last[~single], weights=ends[~single]-last[~single]*binsize, minlength=n_bins+1)
+    full_bins = np.bincount(first[~single]+1, minlength=n_bins+1)-np.bincount(last[~single], minlength=n_bins+1)
+    areas += np.cumsum(full_bins)*binsize
+    # The last bin is cut short at the end of the chromosome
+    bin_sizes = np.minimum(size-np.arange(n_bins)*binsize, binsize)
+    return areas[:n_bins]/bin_sizes
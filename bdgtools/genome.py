@@ -0,0 +1,50 @@
+import logging
+import numpy as np
+from .bedgraph import BedGraph
+from .regions import Regions
+
+log = logging
+
+class Genome:
+    name = "genome"
+
+    def __init__(self, chrom_sizes, padding=0):
+        self._chrom_sizes = dict(chrom_sizes)
+        self._padding = int(padding)
+        sizes = np.array(list(self._chrom_sizes.values()), dtype="int64")
+        offsets = self._padding + np.insert(np.cumsum(sizes+self._padding), 0, 0)
+        self._offsets = dict(zip(self._chrom_sizes, offsets[:-1]))
+        self._size = int(offsets[-1])
+
+    def __repr__(self):
+        return f"Genome({self._chrom_sizes}, {self._padding})"
+
+    def _get_chroms(self, chroms):
+        missing = [chrom for chrom in chroms if chrom not in self._offsets]
+        if missing:
+            log.warning("Skipping chromosomes not in the genome: %s", missing)
+        chroms = set(chroms)
+        return [chrom for chrom in self._chrom_sizes if chrom in chroms]
+
+    def flatten_bedgraphs(self, bedgraphs):
+        bedgraphs = dict(bedgraphs)
+        indices, values = ([np.array([0])], [np.array([0], dtype="float")])
+        for chrom in self._get_chroms(bedgraphs):
+            bedgraph, offset = (bedgraphs[chrom], self._offsets[chrom])
+            end = bedgraph._get_end_index()
+            assert end <= self._chrom_sizes[chrom], (chrom, end, self._chrom_sizes[chrom])
+            indices.extend([bedgraph._indices+offset, [offset+end]])
+            values.extend([bedgraph._values, [0]])
+        indices, values = (np.concatenate(indices), np.concatenate(values))
+        mask = np.append(indices[:-1] < indices[1:], indices[-1] < self._size)
+        return BedGraph(indices[mask], values[mask], self._size)
+
+    def flatten_values(self, values_dict):
+        return np.concatenate([values_dict[chrom] for chrom in self._get_chroms(values_dict)])
+
+    def flatten_regions(self, regions):
+        chroms = self._get_chroms(regions)
+        offsets = [self._offsets[chrom] for chrom in chroms]
+        return Regions(np.concatenate([regions[chrom].starts+o for chrom, o in zip(chroms, offsets)]),
+                       np.concatenate([regions[chrom].ends+o for chrom, o in zip(chroms, offsets)]),
+                       np.concatenate([regions[chrom].directions for chrom in chroms]))
@@ -1,11 +1,14 @@
 import logging
-from itertools import chain, groupby
+from itertools import chain, groupby, zip_longest
 from more_itertools import pairwise
 from operator import itemgetter
+from queue import Queue, Empty
+from threading import Thread, Event
 import pandas as pd
 import numpy as np
 from .regions import Regions
 from .splitregions import SplitRegions, Genes
+from .peakcalling import Peaks
 from .bedgraph import BedGraph, broadcast
 
 log = logging
@@ -16,21 +19,61 @@ def _peek_line(f):
     f.seek(pos)
     return line
 
-def read_bedfile(file_obj):
+def _get_dtypes(**dtypes):
+    return {col: dtype for col, dtype in dtypes.items() if dtype is not None}
+
+def _parse_strands(strands):
+    lookup = np.where(strands.cat.categories == "-", -1, 1).astype(np.int8)
+    return np.append(lookup, np.int8(1))[strands.cat.codes.values]
+
+def _get_chrom_bounds(codes):
+    if not codes.size:
+        return np.array([0])
+    changes = np.flatnonzero(codes[1:] != codes[:-1])+1
+    return np.concatenate(([0], changes, [codes.size]))
+
+def _is_sorted(codes, starts, bounds):
+    if np.unique(codes[bounds[:-1]]).size != bounds.size-1:
+        return False
+    unsorted = np.flatnonzero(starts[1:] < starts[:-1])+1
+    return np.all(np.isin(unsorted, bounds))
+
+def read_bedfile(file_obj, index_dtype=None):
     n_cols = len(_peek_line(file_obj).split("\t"))
     assert n_cols >=3, n_cols
+    dtype = _get_dtypes(chrom="category", start=index_dtype, end=index_dtype)
     if n_cols < 6:
-        table = pd.read_table(file_obj, names=["chrom", "start", "end"], usecols=[0, 1, 2])
+        table = pd.read_table(file_obj, names=["chrom", "start", "end"], usecols=[0, 1, 2], dtype=dtype)
+        directions = None
     else:
-        table = pd.read_table(file_obj, names=["chrom", "start", "end", "direction"], usecols=[0, 1, 2, 5])
-    table = table.sort_values(["chrom", "start"])
-    changes = np.flatnonzero(table["chrom"].values[:-1] != table["chrom"].values[1:])+1
-    changes = np.concatenate(([0], changes, [table["chrom"].values.size]))
-    chrom_split = (table.iloc[start:end] for start, end in zip(changes[:-1], changes[1:]))
-    r =  {t["chrom"].iloc[0]: Regions(t["start"].values, t["end"].values,
-                                      np.where(t["direction"].values=="+", 1, -1) if n_cols>=6 else 1)
-          for t in chrom_split}
-    return r
+        dtype["direction"] = "category"
+        table = pd.read_table(file_obj, names=["chrom", "start", "end", "direction"], usecols=[0, 1, 2, 5], dtype=dtype)
+        directions = _parse_strands(table["direction"])
+    codes = table["chrom"].cat.codes.values
+    starts, ends = (table["start"].values, table["end"].values)
+    bounds = _get_chrom_bounds(codes)
+    if not _is_sorted(codes, starts, bounds):
+        args = np.lexsort((starts, codes))
+        codes, starts, ends = (codes[args], starts[args], ends[args])
+        directions = directions[args] if directions is not None else None
+        bounds = _get_chrom_bounds(codes)
+    chroms = table["chrom"].cat.categories[codes[bounds[:-1]]]
+    return {chrom: Regions(starts[start:end], ends[start:end],
+                           directions[start:end] if directions is not None else 1)
+            for chrom, start, end in zip(chroms, bounds[:-1], bounds[1:])}
+
+def _split_chunk(chunk):
+    bounds = _get_chrom_bounds(chunk["chrom"].cat.codes.values)
+    chroms = chunk["chrom"].values[bounds[:-1]]
+    return ((chrom, chunk.iloc[start:end]) for chrom, start, end in zip(chroms, bounds[:-1], bounds[1:]))
+
+def _group_chunks(reader):
+    grouped = groupby(chain.from_iterable(_split_chunk(chunk) for chunk in reader), itemgetter(0))
+    return ((chrom, map(itemgetter(1),  group)) for chrom, group in grouped)
+
+def read_chrom_sizes(file_obj):
+    table = pd.read_table(file_obj, names=["chrom", "size"], usecols=[0, 1], dtype={"chrom": str})
+    return dict(zip(table["chrom"], table["size"]))
 
 def _fix_bedgraph(starts, ends, values):
     ends_w_zero = np.insert(ends[:-1], 0, 0)
@@ -66,13 +109,60 @@ def _get_bedgraph(chunks):
                     values,
                     chunks[-1]["end"].values[-1])
 
-def read_bedgraph(file_obj, size_hint=1000000):
-    reader = pd.read_table(file_obj, names=["chrom", "start", "end", "value"], usecols=[0, 1, 2, 3], chunksize=size_hint)
-    grouped = groupby(chain.from_iterable(chunk.groupby("chrom", sort=False) for chunk in reader), 
-                      itemgetter(0))
-    grouped = ((chrom, map(itemgetter(1),  group)) for chrom, group in grouped)
-    return ((chrom, _get_bedgraph(group)) for chrom, group in grouped)
+def read_bedgraph(file_obj, size_hint=1000000, index_dtype=None, value_dtype=None):
+    dtype = _get_dtypes(chrom="category", start=index_dtype, end=index_dtype, value=value_dtype)
+    reader = pd.read_table(file_obj, names=["chrom", "start", "end", "value"], usecols=[0, 1, 2, 3],
+                           dtype=dtype, chunksize=size_hint)
+    return ((chrom, _get_bedgraph(group)) for chrom, group in _group_chunks(reader))
+
+
+def zip_bedgraphs(*streams):
+    for items in zip_longest(*streams):
+        if any(item is None for item in items):
+            present = [item[0] for item in items if item is not None]
+            raise ValueError(f"Chromosome {present[0]} is missing from some of the tracks")
+        chroms = [chrom for chrom, _ in items]
+        if any(chrom != chroms[0] for chrom in chroms):
+            raise ValueError(f"Tracks must have the same chromosomes in the same order: {chroms}")
+        yield chroms[0], [bedgraph for _, bedgraph in items]
+
+_end_of_stream = object()
+
+def prefetch(iterable, depth=2):
+    if depth <= 0:
+        yield from iterable
+        return
+    queue = Queue(maxsize=depth)
+    stop = Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                queue.put((item, None))
+        except BaseException as e:
+            queue.put((_end_of_stream, e))
+        else:
+            queue.put((_end_of_stream, None))
 
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is _end_of_stream:
+                return
+            yield item
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                queue.get_nowait()
+            except Empty:
+                thread.join(0.01)
 
 def _get_bedfile(chunks, with_strand=False):
     chunks = list(chunks)
@@ -80,7 +170,7 @@ def _get_bedfile(chunks, with_strand=False):
     starts = np.concatenate([c["start"].values for c in chunks])
     ends = np.concatenate([c["end"].values for c in chunks])
     if with_strand:
-        strands = np.concatenate([np.where(c["strand"].values=="+", 1, -1) for c in chunks])
+        strands = np.concatenate([_parse_strands(c["strand"]) for c in chunks])
     else:
         strands=1
     log.info("Read chromosome", cur_chrom)
@@ -88,19 +178,79 @@ def _get_bedfile(chunks, with_strand=False):
                    ends,
                    strands)
 
-def read_large_bedfile(file_obj, size_hint=1000000):
+def read_large_bedfile(file_obj, size_hint=1000000, index_dtype=None):
     n_cols = len(_peek_line(file_obj).split("\t"))
     assert n_cols >=3, n_cols
     names=["chrom", "start", "end"]
     cols = [0, 1, 2]
-    if n_cols>=6:
+    with_strand = n_cols >= 6
+    if with_strand:
         names.append("strand")
         cols.append(5)
-    reader = pd.read_table(file_obj, names=names, usecols=cols, chunksize=size_hint)
-    grouped = groupby(chain.from_iterable(chunk.groupby("chrom", sort=False) for chunk in reader), 
-                      itemgetter(0))
-    grouped = ((chrom, map(itemgetter(1),  group)) for chrom, group in grouped)
-    return ((chrom, _get_bedfile(group)) for chrom, group in grouped)
+    reader = pd.read_table(file_obj, names=names, usecols=cols, chunksize=size_hint,
+                           dtype=_get_dtypes(chrom="category", strand="category" if with_strand else None,
+                                             start=index_dtype, end=index_dtype))
+    return ((chrom, _get_bedfile(group, with_strand)) for chrom, group in _group_chunks(reader))
+
+def _get_bedpe_fragments(chunk):
+    chunk = chunk[(chunk["chrom"].values == chunk["chrom2"].values) & (chunk["start"].values >= 0) & (chunk["start2"].values >= 0)]
+    return pd.DataFrame({"chrom": chunk["chrom"].values,
+                         "start": np.minimum(chunk["start"].values, chunk["start2"].values),
+                         "end": np.maximum(chunk["end"].values, chunk["end2"].values),
+                         "strand": chunk["strand"].values})
+
+def _get_mate_fragments(chunk):
+    names = chunk["name"].str.replace(r"/[12]$", "", regex=True).values
+    # Order mates by name with read 1 first, so each pair takes the strand of read 1
+    args = np.argsort(chunk["name"].str.endswith("/2").values, kind="mergesort")
+    args = args[np.argsort(names[args], kind="mergesort")]
+    _, first, counts = np.unique(names[args], return_index=True, return_counts=True)
+    if np.any(counts > 2):
+        log.warning("Skipping %s reads sharing a name with an already paired read", (counts[counts > 2]-2).sum())
+    first, second, single = (args[first[counts >= 2]], args[first[counts >= 2]+1], args[first[counts == 1]])
+    chroms, starts, ends = (chunk["chrom"].values, chunk["start"].values, chunk["end"].values)
+    same_chrom = chroms[first] == chroms[second]
+    first, second = (first[same_chrom], second[same_chrom])
+    fragments = pd.DataFrame({"chrom": chroms[first],
+                              "start": np.minimum(starts[first], starts[second]),
+                              "end": np.maximum(ends[first], ends[second]),
+                              "strand": chunk["strand"].values[first]})
+    return fragments, dict(zip(names[single], chunk.iloc[single].itertuples(index=False, name=None)))
+
+def _pair_mates(reader):
+    # Reads whose mate has not been seen yet, keyed by read name
+    unpaired = {}
+    for chunk in reader:
+        if unpaired:
+            chunk = pd.concat((pd.DataFrame(list(unpaired.values()), columns=chunk.columns), chunk), ignore_index=True)
+        fragments, unpaired = _get_mate_fragments(chunk)
+        yield fragments
+    if unpaired:
+        log.warning("Skipping %s reads without a mate", len(unpaired))
+
+def read_fragments(file_obj, size_hint=1000000, index_dtype=None, paired_bed=False):
+    """Read fragments from BEDPE, or from paired BED with mates sharing a read name, in any order
+
+    Fragments are collected for all chromosomes before they are yielded sorted by chromosome and start"""
+    dtype = _get_dtypes(chrom=str, chrom2=str, name=str, strand=str, start=index_dtype, end=index_dtype,
+                        start2=index_dtype, end2=index_dtype)
+    if paired_bed:
+        names, cols = (["chrom", "start", "end", "name", "strand"], [0, 1, 2, 3, 5])
+    else:
+        names, cols = (["chrom", "start", "end", "chrom2", "start2", "end2", "strand"], [0, 1, 2, 3, 4, 5, 8])
+    reader = pd.read_table(file_obj, names=names, usecols=cols, chunksize=size_hint,
+                           dtype={name: t for name, t in dtype.items() if name in names})
+    frames = _pair_mates(reader) if paired_bed else map(_get_bedpe_fragments, reader)
+    groups = {}
+    for frame in frames:
+        for chrom, group in frame.groupby("chrom", sort=False):
+            groups.setdefault(chrom, []).append(group)
+    for chrom in sorted(groups):
+        starts = np.concatenate([g["start"].values for g in groups[chrom]])
+        ends = np.concatenate([g["end"].values for g in groups[chrom]])
+        strands = np.concatenate([np.where(g["strand"].values == "-", -1, 1).astype(np.int8) for g in groups[chrom]])
+        args = np.argsort(starts, kind="mergesort")
+        yield chrom, Regions(starts[args], ends[args], strands[args])
 
 def _filter_coding(df):
     s = np.array([starts[0] for starts in df["exon_starts"]])
@@ -162,7 +312,7 @@ def write_bedgraph(bedgraphs, f):
         if bedgraph._size is not None:
             df = pd.DataFrame({"chrom": chrom,
                                "start": bedgraph._indices,
-                               "end": np.append(bedgraph._indices, bedgraph._size),
+                               "end": np.append(bedgraph._indices[1:], bedgraph._size),
                                "value": bedgraph._values})
         else:
             df = pd.DataFrame({"chrom": chrom,
@@ -171,13 +321,45 @@ def write_bedgraph(bedgraphs, f):
                                "value": bedgraph._values[:-1]})
         df.to_csv(f, sep="\t", header=False, index=False)
 
+def write_fixed_step(binned, binsize, f):
+    """Write (chrom, size, values) bins, with a separate block for a last bin cut short at size"""
+    for chrom, size, values in binned:
+        n_full = min(size//binsize, values.size)
+        if n_full:
+            f.write("fixedStep chrom=%s start=1 step=%s span=%s\n" % (chrom, binsize, binsize))
+            pd.Series(values[:n_full]).to_csv(f, header=False, index=False)
+        if n_full < values.size:
+            f.write("fixedStep chrom=%s start=%s step=%s span=%s\n" % (chrom, n_full*binsize+1, binsize, size-n_full*binsize))
+            pd.Series(values[n_full:]).to_csv(f, header=False, index=False)
+
 def write_bedfile(regions_dict, f):
-    for chrom, regions in regions_dict.items():
+    """Peaks are written as narrowPeak, with the area as signal value and the summit as offset from start"""
+    items = regions_dict.items() if isinstance(regions_dict, dict) else regions_dict
+    n_peaks = 0
+    for chrom, regions in items:
         df = pd.DataFrame({"chrom": chrom,
                            "start": regions.starts,
                            "end": regions.ends})
+        if isinstance(regions, Peaks):
+            df["name"] = ["peak_%s" % i for i in range(n_peaks+1, n_peaks+len(regions)+1)]
+            df["score"] = regions.maxes
+            df["strand"] = "."
+            df["signal"] = regions.areas
+            df["pvalue"] = -1
+            df["qvalue"] = -1
+            df["summit"] = regions.summits-regions.starts
+            n_peaks += len(regions)
+        df.to_csv(f, sep="\t", header=False, index=False)
+
+def write_region_scores(scores, f):
+    for chrom, regions, sums, covered in scores:
+        sizes = regions.sizes()
+        df = pd.DataFrame({"chrom": chrom,
+                           "start": regions.starts,
+                           "end": regions.ends,
+                           "size": sizes,
+                           "covered": covered,
+                           "sum": sums,
+                           "mean0": sums/sizes,
+                           "mean": sums/np.maximum(covered, 1)})
         df.to_csv(f, sep="\t", header=False, index=False)
-                         
-                         
-        
-        
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+enabled = numba is not None and not os.environ.get("BDGTOOLS_NO_JIT")
+
+def set_enabled(flag):
+    global enabled
+    enabled = bool(flag) and numba is not None
+
+def jit(func):
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+@jit
+def extract_regions(indices, values, size, starts, ends, directions, start_idxs, offsets, out_indices, out_values):
+    for r in range(starts.size):
+        for i in range(offsets[r], offsets[r+1]):
+            j = i-offsets[r]
+            if directions[r] == 1:
+                src = start_idxs[r]+j
+                out_indices[i] = indices[src]-starts[r]
+            else:
+                src = start_idxs[r]+offsets[r+1]-1-i
+                end = indices[src+1] if src+1 < indices.size else size
+                out_indices[i] = ends[r]-end
+            out_values[i] = values[src]
+        out_indices[offsets[r]] = 0
+
+@jit
+def scale_x(indices, values, sizes, offsets, size, out_indices, out_values, out_offsets):
+    k = 0
+    for r in range(sizes.size):
+        old_size = sizes[r]
+        row_end = offsets[r+1]
+        for i in range(offsets[r], row_end):
+            new_index = np.int64(indices[i])*size//old_size
+            if i+1 < row_end and np.int64(indices[i+1])*size//old_size <= new_index:
+                continue
+            out_indices[k] = new_index
+            out_values[k] = values[i]
+            k += 1
+        out_offsets[r+1] = k
+    return k
+
+@jit
+def update_dense_diffs(indices, values, offsets, rows, diffs):
+    for r in range(rows.size):
+        prev = values[offsets[r]]
+        diffs[rows[r], indices[offsets[r]]] += prev
+        for i in range(offsets[r]+1, offsets[r+1]):
+            diffs[rows[r], indices[i]] += values[i]-prev
+            prev = values[i]
+
+@jit
+def col_diffs(indices, values, offsets, diffs, breaks):
+    for r in range(offsets.size-1):
+        prev = values[offsets[r]]
+        diffs[indices[offsets[r]]] += prev
+        breaks[indices[offsets[r]]] = True
+        for i in range(offsets[r]+1, offsets[r+1]):
+            diffs[indices[i]] += values[i]-prev
+            breaks[indices[i]] = True
+            prev = values[i]
+
+@jit
+def coverage(starts, ends, out_indices, out_values):
+    i = j = k = 0
+    depth = 0
+    n = starts.size
+    while j < n:
+        pos = starts[i] if i < n and starts[i] < ends[j] else ends[j]
+        while i < n and starts[i] == pos:
+            depth += 1
+            i += 1
+        while j < n and ends[j] == pos:
+            depth -= 1
+            j += 1
+        if k == 0 or out_values[k-1] != depth:
+            out_indices[k] = pos
+            out_values[k] = depth
+            k += 1
+    return k
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from .regions import Regions
+
+def _get_windows(regions, region_size):
+    if region_size is None:
+        return regions
+    mids = (regions.ends+regions.starts)//2
+    return Regions(mids-region_size//2, mids+region_size//2, regions.directions)
+
+def get_region_table(regions):
+    table = pd.concat([pd.DataFrame({"chrom": chrom,
+                                     "start": r.starts,
+                                     "end": r.ends,
+                                     "strand": np.where(r.directions == 1, "+", "-")})
+                       for chrom, r in regions.items()], ignore_index=True)
+    table["row"] = np.arange(len(table))
+    return table
+
+def compute_matrix(bedgraphs, regions, out_path, width, region_size=None, batch_size=10000, dtype="float32"):
+    counts = [r.starts.size for r in regions.values()]
+    row_offsets = dict(zip(regions, np.cumsum([0]+counts)))
+    matrix = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=(sum(counts), width))
+    for chrom, bedgraph in bedgraphs:
+        if chrom not in regions:
+            continue
+        windows = _get_windows(regions[chrom], region_size)
+        for start in range(0, len(windows), batch_size):
+            batch = windows[start:start+batch_size]
+            row = row_offsets[chrom]+start
+            matrix[row:row+len(batch)] = batch.get_signals(bedgraph).scale_x(width).to_dense(dtype)
+    matrix.flush()
+    return matrix
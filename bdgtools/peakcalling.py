@@ -0,0 +1,70 @@
+import numpy as np
+from .regions import Regions
+from .bedgraph import broadcast
+
+
+class Peaks(Regions):
+    def __init__(self, starts, ends, maxes, summits, areas):
+        super().__init__(starts, ends)
+        self.maxes = np.asanyarray(maxes)
+        self.summits = np.asanyarray(summits)
+        self.areas = np.asanyarray(areas)
+
+    def __getitem__(self, idx):
+        return self.__class__(self.starts[idx], self.ends[idx], self.maxes[idx], self.summits[idx], self.areas[idx])
+
+    def __eq__(self, other):
+        t = super().__eq__(other)
+        t &= np.all(self.maxes == other.maxes)
+        t &= np.all(self.summits == other.summits)
+        return t & np.all(self.areas == other.areas)
+
+    def __repr__(self):
+        return f"Peaks({self.starts}, {self.ends}, {self.maxes}, {self.summits}, {self.areas})"
+
+
+def _get_local_means(bedgraph, window):
+    end = bedgraph._get_end_index()
+    mids = (bedgraph._indices+np.append(bedgraph._indices[1:], end))//2
+    starts = np.maximum(mids-window//2, 0)
+    ends = np.minimum(mids+window//2, end)
+    return bedgraph.range_sums(starts, ends)/np.maximum(ends-starts, 1)
+
+
+def _merge_runs(starts, ends, start_idxs, end_idxs, max_gap):
+    new_group = np.insert(starts[1:]-ends[:-1] > max_gap, 0, True)
+    first = np.flatnonzero(new_group)
+    last = np.append(first[1:], starts.size)-1
+    return starts[first], ends[last], start_idxs[first], end_idxs[last]
+
+
+def _get_summits(bedgraph, indices, start_idxs, end_idxs, maxes):
+    offsets = np.insert(np.cumsum(end_idxs-start_idxs), 0, 0)
+    run_idxs = np.arange(offsets[-1])-broadcast(offsets[:-1], offsets)+broadcast(start_idxs, offsets)
+    is_max = bedgraph._values[run_idxs] == broadcast(maxes, offsets)
+    peak_ids = broadcast(np.arange(maxes.size), offsets)
+    _, first = np.unique(peak_ids[is_max], return_index=True)
+    max_runs = run_idxs[is_max][first]
+    return (indices[max_runs]+indices[max_runs+1])//2
+
+
+def call_peaks(bedgraph, threshold, min_length=0, max_gap=0, background_window=None, fold=1.0):
+    values = bedgraph._values
+    cumulative_areas = bedgraph._get_cumulative_areas()
+    over = values >= threshold
+    if background_window is not None:
+        over &= values >= fold*_get_local_means(bedgraph, background_window)
+    start_idxs, end_idxs = bedgraph._get_runs(over)
+    indices = np.append(bedgraph._indices, bedgraph._get_end_index())
+    starts, ends = (indices[start_idxs], indices[end_idxs])
+    if starts.size:
+        starts, ends, start_idxs, end_idxs = _merge_runs(starts, ends, start_idxs, end_idxs, max_gap)
+    mask = (ends-starts >= min_length) & (ends > starts)
+    starts, ends, start_idxs, end_idxs = (starts[mask], ends[mask], start_idxs[mask], end_idxs[mask])
+    if not starts.size:
+        return Peaks(starts, ends, values[:0], starts, values[:0])
+    bounds = np.ravel(np.column_stack((start_idxs, end_idxs)))
+    maxes = np.maximum.reduceat(np.append(values, values[-1]), bounds)[::2]
+    summits = _get_summits(bedgraph, indices, start_idxs, end_idxs, maxes)
+    areas = cumulative_areas[end_idxs]-cumulative_areas[start_idxs]
+    return Peaks(starts, ends, maxes, summits, areas)
@@ -5,18 +5,45 @@ import matplotlib.pyplot as plt
 from .aggregateplot import *
 sns.set_theme()
 
-def plot(df, cls, save_path=None, show=False):
+def _get_extent(df):
+    # Rows are drawn at their index position, since the y-axis (e.g. HeatPlot ranks) need not be evenly spaced
+    x = np.asanyarray(df.columns, dtype="float")
+    dx = (x[-1]-x[0])/max(x.size-1, 1)
+    return (x[0], x[-1]+dx, len(df.index)-0.5, -0.5)
+
+def _get_row_ticks(index, n_ticks=6):
+    rows = np.unique(np.linspace(0, len(index)-1, min(n_ticks, len(index))).round().astype(int))
+    return rows, [str(index[row]) for row in rows]
+
+def plot_matrix(df, ax=None, cmap="gray_r"):
+    if ax is None:
+        ax = plt.gca()
+    im = ax.imshow(df.values, cmap=cmap, aspect="auto", interpolation="nearest", extent=_get_extent(df))
+    rows, labels = _get_row_ticks(df.index)
+    ax.set_yticks(rows)
+    ax.set_yticklabels(labels)
+    ax.grid(False)
+    ax.figure.colorbar(im, ax=ax)
+    return ax
+
+def save_image(df, save_path, cmap="gray_r"):
+    plt.imsave(save_path, df.values, cmap=cmap, origin="upper")
+
+def plot(df, plot_obj, save_path=None, show=False):
     if save_path is None and not show:
         return
+    cls = plot_obj if isinstance(plot_obj, type) else plot_obj.__class__
     plt.figure(figsize=(10, 10))
-    if isinstance(cls, SignalPlot):
+    if issubclass(cls, SignalPlot):
         kwargs = {"size": "region", "size_order": ["cds", "utr_l", "utr_r"]} if "region" in df else {}
         p = sns.lineplot(data=df, x="x", y="y", **kwargs)
+        if "lower" in df:
+            p.fill_between(df["x"], df["lower"], df["upper"], alpha=0.3)
     else:
-        p = sns.heatmap(df, cmap="gray_r")
-    p.set_xlabel(cls.xlabel)
-    p.set_ylabel(cls.ylabel)
-    p.set_title(f"{cls.__class__.__name__}")
+        p = plot_matrix(df)
+    p.set_xlabel(plot_obj.xlabel)
+    p.set_ylabel(plot_obj.ylabel)
+    p.set_title(f"{cls.__name__}")
     if save_path is not None:
         plt.savefig(save_path)
     if show:
@@ -43,7 +70,7 @@ def join_plots(dfs, names, cls, save_path=None, show=False, name=""):
         f.suptitle(name)
         for i, (df, name) in enumerate(zip(dfs, names)):
             ax = axes[i//cols, i%cols]
-            sns.heatmap(df, cmap="gray_r", ax=ax)
+            plot_matrix(df, ax=ax)
             ax.set_title(name)
             ax.set_xlabel(cls.xlabel)
         for a in axes[:, 0]:
@@ -53,3 +80,21 @@ def join_plots(dfs, names, cls, save_path=None, show=False, name=""):
     if show:
         plt.show()
 
+def _render(args):
+    data_file, cls, save_path, raw = args
+    df = pd.read_pickle(data_file)
+    if raw and issubclass(cls, MatrixPlot):
+        save_image(df, save_path)
+    else:
+        plot(df, cls, save_path=save_path)
+    plt.close("all")
+    return save_path
+
+def _init_headless():
+    plt.switch_backend("Agg")
+
+def render_batch(data_files, cls, save_paths, processes=None, raw=False):
+    from multiprocessing import Pool
+    jobs = [(data_file, cls, save_path, raw) for data_file, save_path in zip(data_files, save_paths)]
+    with Pool(processes, initializer=_init_headless) as pool:
+        return pool.map(_render, jobs)
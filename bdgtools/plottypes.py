@@ -0,0 +1,7 @@
+# Kept free of heavy imports so the CLI can build its choices without loading pandas/matplotlib
+plot_types = {"v": "VPlot", "average": "AveragePlot", "heat": "HeatPlot", "tss": "TSSPlot", "signal": "SignalPlot",
+              "metagene": "MetaGenePlot", "border": "BorderPlot"}
+
+def get_plot_class(plot_type):
+    from . import aggregateplot
+    return getattr(aggregateplot, plot_types[plot_type])
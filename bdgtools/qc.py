@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from .util import get_average_ranks
+
+def _correlations(n, sums, products):
+    means = sums/n
+    cov = products/n-np.outer(means, means)
+    sd = np.sqrt(np.diag(cov))
+    return cov/np.outer(sd, sd)
+
+class TrackQC:
+    def __init__(self, names, binsize=None, keep_bins=False):
+        assert binsize is not None or not keep_bins, "Only binned tracks can be kept"
+        self._names = list(names)
+        self._binsize = binsize
+        self._keep_bins = keep_bins
+        k = len(self._names)
+        self._n = 0
+        self._sums = np.zeros(k)
+        self._products = np.zeros((k, k))
+        self._hists = [np.zeros(1) for _ in self._names]
+        self._bins = []
+
+    def _merge_breakpoints(self, bedgraphs):
+        ends = np.array([bg._get_end_index() for bg in bedgraphs])
+        size = ends.max()
+        indices = np.unique(np.concatenate([bg._indices for bg in bedgraphs] + [ends[ends < size]]))
+        values = np.array([np.where(indices < end,
+                                    bg._values[np.searchsorted(bg._indices, indices, side="right")-1], 0)
+                           for bg, end in zip(bedgraphs, ends)])
+        return values, np.diff(indices, append=size)
+
+    def _get_bin_means(self, bedgraphs):
+        size = max(bg._get_end_index() for bg in bedgraphs)
+        starts = np.arange(0, size, self._binsize)
+        ends = np.minimum(starts+self._binsize, size)
+        sums = []
+        for bg in bedgraphs:
+            end = bg._get_end_index()
+            sums.append(bg.range_sums(np.minimum(starts, end), np.minimum(ends, end)))
+        return np.array(sums)/(ends-starts)
+
+    def update(self, chrom, bedgraphs):
+        assert len(bedgraphs) == len(self._names), (chrom, len(bedgraphs))
+        if self._binsize is None:
+            values, weights = self._merge_breakpoints(bedgraphs)
+        else:
+            values = self._get_bin_means(bedgraphs)
+            weights = np.ones(values.shape[1])
+            if self._keep_bins:
+                self._bins.append(values)
+        self._n += weights.sum()
+        self._sums += values @ weights
+        self._products += (values*weights) @ values.T
+        for i, bg in enumerate(bedgraphs):
+            h = bg.hist()
+            if h.size > self._hists[i].size:
+                h, self._hists[i] = (self._hists[i], h)
+            self._hists[i][:h.size] += h
+
+    def pearson(self):
+        return pd.DataFrame(_correlations(self._n, self._sums, self._products),
+                            index=self._names, columns=self._names)
+
+    def spearman(self):
+        assert self._keep_bins, "Spearman correlation needs the bins, set keep_bins"
+        ranks = np.array([get_average_ranks(row) for row in np.hstack(self._bins)])
+        n = ranks.shape[1]
+        return pd.DataFrame(_correlations(n, ranks.sum(axis=1), ranks @ ranks.T),
+                            index=self._names, columns=self._names)
+
+    def fingerprints(self):
+        tables = []
+        for name, h in zip(self._names, self._hists):
+            values = np.arange(h.size)
+            tables.append(pd.DataFrame({"name": name,
+                                        "value": values,
+                                        "fraction_at_least": 1-np.insert(np.cumsum(h), 0, 0)[:-1]/h.sum(),
+                                        "genome_fraction": np.cumsum(h)/h.sum(),
+                                        "signal_fraction": np.cumsum(h*values)/max(np.sum(h*values), 1)}))
+        return pd.concat(tables, ignore_index=True)
@@ -25,6 +25,12 @@ class Regions:
             return (Region(s, e, 1) for s, e in zip(self.starts, self.ends))
         return (Region(*t) for t in zip(self.starts, self.ends, self.directions))
 
+    def __getitem__(self, idx):
+        return self.__class__(self.starts[idx], self.ends[idx], self.directions[idx])
+
+    def __len__(self):
+        return self.starts.size
+
     def __eq__(self, other):
         t = np.all(self.starts==other.starts)
         t &= np.all(self.ends==other.ends)
@@ -39,6 +45,105 @@ class Regions:
     def get_signals(self, bedgraph):
         return bedgraph.extract_regions(self)
 
+    def unique(self):
+        args = np.lexsort((self.directions, self.ends, self.starts))
+        r = self[args]
+        new = np.ones(args.size, dtype=bool)
+        new[1:] = (r.starts[1:] != r.starts[:-1]) | (r.ends[1:] != r.ends[:-1]) | (r.directions[1:] != r.directions[:-1])
+        return r[new]
+
+    def filter_sizes(self, min_size=None, max_size=None):
+        mask = np.ones(len(self), dtype=bool)
+        if min_size is not None:
+            mask &= self.sizes() >= min_size
+        if max_size is not None:
+            mask &= self.sizes() <= max_size
+        return self[mask]
+
+    def _sorted(self):
+        args = self.starts.argsort(kind="mergesort")
+        return Regions(self.starts[args], self.ends[args], self.directions[args])
+
+    def merge(self, distance=0):
+        if not self.starts.size:
+            return Regions(self.starts, self.ends)
+        r = self._sorted()
+        max_ends = np.maximum.accumulate(r.ends)
+        new_group = np.insert(r.starts[1:] > max_ends[:-1]+distance, 0, True)
+        first = np.flatnonzero(new_group)
+        last = np.append(first[1:], r.starts.size)-1
+        return Regions(r.starts[first], max_ends[last])
+
+    def _get_overlap_idxs(self, merged):
+        lo = np.searchsorted(merged.ends, self.starts, side="right")
+        hi = np.searchsorted(merged.starts, self.ends, side="left")
+        return lo, np.maximum(hi, lo)
+
+    def intersect(self, other):
+        merged = other.merge()
+        lo, hi = self._get_overlap_idxs(merged)
+        counts = hi-lo
+        idxs = np.repeat(np.arange(self.starts.size), counts)
+        other_idxs = np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts, counts)+np.repeat(lo, counts)
+        starts = np.maximum(self.starts[idxs], merged.starts[other_idxs])
+        ends = np.minimum(self.ends[idxs], merged.ends[other_idxs])
+        return Regions(starts, ends, self.directions[idxs])
+
+    def subtract(self, other):
+        merged = other.merge()
+        lo, hi = self._get_overlap_idxs(merged)
+        counts = hi-lo+1
+        idxs = np.repeat(np.arange(self.starts.size), counts)
+        first = np.cumsum(counts)-counts
+        last = first+counts-1
+        other_idxs = np.arange(counts.sum())-np.repeat(first, counts)+np.repeat(lo, counts)
+        starts = np.empty(idxs.size, dtype=self.starts.dtype)
+        starts[first] = self.starts
+        inner = np.ones(idxs.size, dtype=bool)
+        inner[first] = False
+        starts[inner] = merged.ends[other_idxs[inner]-1]
+        ends = np.empty(idxs.size, dtype=self.ends.dtype)
+        ends[last] = self.ends
+        inner = np.ones(idxs.size, dtype=bool)
+        inner[last] = False
+        ends[inner] = merged.starts[other_idxs[inner]]
+        mask = ends > starts
+        return Regions(starts[mask], ends[mask], self.directions[idxs][mask])
+
+    def count_overlaps(self, other):
+        n_started = np.searchsorted(np.sort(other.starts), self.ends, side="left")
+        n_ended = np.searchsorted(np.sort(other.ends), self.starts, side="right")
+        return n_started-n_ended
+
+    def closest(self, other, same_strand=False):
+        # Distances are 0 for overlaps and negative for upstream regions
+        if same_strand:
+            idxs = np.full(self.starts.size, -1)
+            distances = np.zeros(self.starts.size, dtype=self.starts.dtype)
+            for direction in (1, -1):
+                mask = self.directions == direction
+                other_idxs = np.flatnonzero(other.directions == direction)
+                sub = Regions(self.starts[mask], self.ends[mask], self.directions[mask])
+                sub_other = Regions(other.starts[other_idxs], other.ends[other_idxs], other.directions[other_idxs])
+                i, distances[mask] = sub.closest(sub_other)
+                idxs[mask] = np.where(i >= 0, other_idxs[np.maximum(i, 0)], -1)
+            return idxs, distances
+        args = other.starts.argsort(kind="mergesort")
+        starts, ends = (other.starts[args], other.ends[args])
+        if not starts.size:
+            return np.full(self.starts.size, -1), np.zeros_like(self.starts)
+        max_end_idxs = np.flatnonzero(np.insert(ends[1:] > np.maximum.accumulate(ends)[:-1], 0, True))
+        prefix_max_idxs = max_end_idxs[np.searchsorted(max_end_idxs, np.arange(ends.size), side="right")-1]
+        left = np.searchsorted(starts, self.ends, side="left")-1
+        left_idxs = prefix_max_idxs[np.maximum(left, 0)]
+        left_dists = np.where(left >= 0, np.maximum(self.starts-ends[left_idxs]+1, 0), np.iinfo(np.int64).max)
+        right_idxs = np.minimum(left+1, starts.size-1)
+        right_dists = np.where(left+1 < starts.size, starts[right_idxs]-self.ends+1, np.iinfo(np.int64).max)
+        use_left = left_dists <= right_dists
+        idxs = args[np.where(use_left, left_idxs, right_idxs)]
+        distances = np.where(use_left, -left_dists, right_dists)*self.directions
+        return idxs, distances
+
     @classmethod
     def concatenate(cls, regions_list):
         starts = np.concatenate([r.starts for r in regions_list])
@@ -53,3 +158,28 @@ def expand(regions, upstream, downstream):
     ends = centers+np.where(regions.directions==1, downstream, upstream)
     args = starts.argsort(kind="mergesort")
     return Regions(starts[args], ends[args], regions.directions[args])
+
+def sample_regions(regions_dict, n=None, fraction=None, n_strata=10, seed=0):
+    assert (n is None) != (fraction is None), "Specify one of n and fraction"
+    chroms = list(regions_dict)
+    sizes = np.concatenate([regions_dict[chrom].sizes() for chrom in chroms])
+    total = sizes.size
+    if n is None:
+        n = int(round(fraction*total))
+    n = min(n, total)
+    ranks = np.empty(total, dtype="int")
+    ranks[np.argsort(sizes, kind="mergesort")] = np.arange(total)
+    strata = ranks*n_strata//max(total, 1)
+    stratum_sizes = np.bincount(strata, minlength=n_strata)
+    targets = np.floor(stratum_sizes*n/max(total, 1)).astype("int")
+    remainder = np.argsort(-(stratum_sizes*n/max(total, 1)-targets), kind="mergesort")[:n-targets.sum()]
+    targets[remainder] += 1
+    keys = np.random.default_rng(seed).random(total)
+    order = np.lexsort((keys, strata))
+    stratum_starts = np.insert(np.cumsum(stratum_sizes), 0, 0)[:-1]
+    positions = np.arange(total)-stratum_starts[strata[order]]
+    mask = np.zeros(total, dtype=bool)
+    mask[order[positions < targets[strata[order]]]] = True
+    offsets = np.cumsum([0]+[len(regions_dict[chrom]) for chrom in chroms])
+    sampled = {chrom: regions_dict[chrom][mask[start:end]] for chrom, start, end in zip(chroms, offsets[:-1], offsets[1:])}
+    return {chrom: r for chrom, r in sampled.items() if len(r)}
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from .bedgraph import BedGraph
+from .compressed import CompressedBedGraph
+from .regions import Regions
+from .io import read_bedgraph, read_bedfile, read_refseq
+from .plottypes import get_plot_class, plot_types
+
+log = logging.getLogger(__name__)
+
+def _track_nbytes(track):
+    return sum(bg.nbytes for bg in track.values())
+
+class TrackStore:
+    """Keeps parsed tracks in memory, evicting the least recently used ones above max_bytes"""
+    def __init__(self, paths, max_bytes=4 << 30, mmap_dir=None, dtypes=None, compress=False):
+        self._paths = {os.path.basename(path): path for path in paths}
+        self._max_bytes = max_bytes
+        self._mmap_dir = mmap_dir
+        self._dtypes = dtypes or {}
+        self._compress = compress
+        self._tracks = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self._paths}
+
+    def names(self):
+        return list(self._paths)
+
+    def loaded(self):
+        with self._lock:
+            return list(self._tracks)
+
+    def get(self, name):
+        if name not in self._paths:
+            raise KeyError("Unknown track: %s" % name)
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._tracks:
+                    self._tracks.move_to_end(name)
+                    return self._tracks[name]
+            track = self._load(self._paths[name])
+            if self._compress:
+                track = {chrom: CompressedBedGraph(bedgraph) for chrom, bedgraph in track.items()}
+            with self._lock:
+                self._tracks[name] = track
+                self._evict()
+            return track
+
+    def _evict(self):
+        total = sum(_track_nbytes(track) for track in self._tracks.values())
+        while total > self._max_bytes and len(self._tracks) > 1:
+            name, track = self._tracks.popitem(last=False)
+            log.info("Evicting %s", name)
+            total -= _track_nbytes(track)
+
+    def _load(self, path):
+        log.info("Loading %s", path)
+        if self._mmap_dir is None:
+            return dict(read_bedgraph(path, **self._dtypes))
+        stat = os.stat(path)
+        key = "%s:%s:%s:%s" % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sorted(self._dtypes.items()))
+        directory = os.path.join(self._mmap_dir, hashlib.sha256(key.encode()).hexdigest())
+        if not os.path.exists(directory):
+            self._write_arrays(read_bedgraph(path, **self._dtypes), directory)
+        return self._read_arrays(directory)
+
+    def _write_arrays(self, bedgraphs, directory):
+        tmp = directory + ".tmp%s" % threading.get_ident()
+        os.makedirs(tmp)
+        sizes = {}
+        for i, (chrom, bedgraph) in enumerate(bedgraphs):
+            np.save(os.path.join(tmp, "%s.indices.npy" % i), bedgraph._indices)
+            np.save(os.path.join(tmp, "%s.values.npy" % i), bedgraph._values)
+            sizes[chrom] = bedgraph._size
+        with open(os.path.join(tmp, "sizes.json"), "w") as f:
+            json.dump(list(sizes.items()), f)
+        os.rename(tmp, directory)
+
+    def _read_arrays(self, directory):
+        with open(os.path.join(directory, "sizes.json")) as f:
+            sizes = json.load(f)
+        return {chrom: BedGraph(np.load(os.path.join(directory, "%s.indices.npy" % i), mmap_mode="r"),
+                                np.load(os.path.join(directory, "%s.values.npy" % i), mmap_mode="r"), size)
+                for i, (chrom, size) in enumerate(sizes)}
+
+def _get_data_path(path, data_dir):
+    if data_dir is None:
+        raise ValueError("Region files are disabled, start the server with a data directory")
+    data_dir = os.path.realpath(data_dir)
+    full_path = os.path.realpath(os.path.join(data_dir, path))
+    if os.path.commonpath([data_dir, full_path]) != data_dir:
+        raise ValueError("Region file outside the data directory: %s" % path)
+    return full_path
+
+def parse_regions(spec, data_dir=None):
+    regions = spec["regions"]
+    if isinstance(regions, str):
+        with open(_get_data_path(regions, data_dir)) as f:
+            return read_refseq(f) if spec.get("format") == "refseq" else read_bedfile(f)
+    by_chrom = {}
+    for region in regions:
+        by_chrom.setdefault(region[0], []).append((region[1], region[2], region[3] if len(region) > 3 else "+"))
+    return {chrom: Regions(np.array([start for start, _, _ in rows]), np.array([end for _, end, _ in rows]),
+                           np.array([-1 if strand == "-" else 1 for _, _, strand in rows]))
+            for chrom, rows in ((chrom, sorted(rows)) for chrom, rows in by_chrom.items())}
+
+def run_plot(store, spec, data_dir=None):
+    if spec.get("plot_type") not in plot_types:
+        raise ValueError("Unknown plot type: %s" % spec.get("plot_type"))
+    track = store.get(spec["track"])
+    regions = parse_regions(spec, data_dir)
+    f = get_plot_class(spec["plot_type"])(**spec.get("options", {}))
+    return f(iter(track.items()), regions)
+
+class PlotRequestHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/tracks":
+            return self._reply(404, {"error": "Not found"})
+        store = self.server.store
+        self._reply(200, {"tracks": store.names(), "loaded": store.loaded()})
+
+    def do_POST(self):
+        if self.path != "/plot":
+            return self._reply(404, {"error": "Not found"})
+        try:
+            spec = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            table = self.server.executor.submit(run_plot, self.server.store, spec, self.server.data_dir).result()
+        except (KeyError, ValueError, TypeError, AssertionError, OSError) as e:
+            return self._reply(400, {"error": "%s: %s" % (e.__class__.__name__, e)})
+        except Exception as e:
+            log.exception("Plot request failed")
+            return self._reply(500, {"error": "%s: %s" % (e.__class__.__name__, e)})
+        self._reply(200, table.to_json(orient="split"))
+
+    def log_message(self, format, *args):
+        log.info(format, *args)
+
+def make_server(store, host="127.0.0.1", port=8765, workers=4, data_dir=None):
+    server = ThreadingHTTPServer((host, port), PlotRequestHandler)
+    server.store = store
+    server.data_dir = data_dir
+    server.executor = ThreadPoolExecutor(workers)
+    return server
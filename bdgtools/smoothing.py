@@ -0,0 +1,52 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .bedgraph import BedGraph
+
+def _get_bins(bedgraph, resolution):
+    size = bedgraph._get_end_index()
+    starts = np.arange(0, size, resolution)
+    return starts, np.minimum(starts+resolution, size)
+
+def _from_bins(values, starts, size):
+    changes = np.insert(values[1:] != values[:-1], 0, True)
+    return BedGraph(starts[changes], values[changes], size)
+
+def binned_means(bedgraph, resolution):
+    starts, ends = _get_bins(bedgraph, resolution)
+    return bedgraph.range_sums(starts, ends)/(ends-starts)
+
+def binned_max(bedgraph, resolution):
+    starts, ends = _get_bins(bedgraph, resolution)
+    lo = np.searchsorted(bedgraph._indices, starts, side="right")-1
+    hi = np.searchsorted(bedgraph._indices, ends, side="left")
+    bounds = np.ravel(np.column_stack((lo, hi)))
+    return np.maximum.reduceat(np.append(bedgraph._values, bedgraph._values[-1]), bounds)[::2]
+
+def moving_average(bedgraph, width, resolution=10):
+    size = bedgraph._get_end_index()
+    starts, _ = _get_bins(bedgraph, resolution)
+    centers = starts+resolution//2
+    window_starts = np.clip(centers-width//2, 0, size)
+    window_ends = np.clip(centers+(width+1)//2, 0, size)
+    values = bedgraph.range_sums(window_starts, window_ends)/np.maximum(window_ends-window_starts, 1)
+    return _from_bins(values, starts, size)
+
+def gaussian(bedgraph, sigma, resolution=10, truncate=4.0):
+    size = bedgraph._get_end_index()
+    starts, _ = _get_bins(bedgraph, resolution)
+    radius = max(int(truncate*sigma/resolution), 1)
+    x = np.arange(-radius, radius+1)*resolution
+    kernel = np.exp(-0.5*(x/sigma)**2)
+    values = np.convolve(binned_means(bedgraph, resolution), kernel)[radius:radius+starts.size]
+    weights = np.convolve(np.ones(starts.size), kernel)[radius:radius+starts.size]
+    return _from_bins(values/weights, starts, size)
+
+def max_filter(bedgraph, width, resolution=10):
+    size = bedgraph._get_end_index()
+    starts, _ = _get_bins(bedgraph, resolution)
+    n = max(width//resolution, 1)
+    values = binned_max(bedgraph, resolution)
+    padded = np.concatenate((np.full(n//2, values.min()), values, np.full(n-1-n//2, values.min())))
+    return _from_bins(sliding_window_view(padded, n).max(axis=1), starts, size)
+
+smoothers = {"mean": moving_average, "gaussian": gaussian, "max": max_filter}
@@ -6,3 +6,30 @@ def get_ranks(array):
     args = np.empty_like(args_tmp)
     args[args_tmp] = np.arange(len(args))
     return args
+
+
+def kmeans(features, k, n_iter=20, seed=0):
+    rng = np.random.default_rng(seed)
+    k = min(k, len(features))
+    centers = features[rng.choice(len(features), k, replace=False)]
+    for _ in range(n_iter):
+        distances = (centers**2).sum(axis=-1)-2*features @ centers.T
+        labels = np.argmin(distances, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, features)
+        new_centers = np.where(counts[:, None] > 0, sums/np.maximum(counts, 1)[:, None], centers)
+        if np.all(new_centers == centers):
+            break
+        centers = new_centers
+    return labels, centers
+
+def get_average_ranks(array):
+    args = np.argsort(array, kind="mergesort")
+    sorted_array = array[args]
+    group_starts = np.flatnonzero(np.insert(sorted_array[1:] != sorted_array[:-1], 0, True))
+    group_ends = np.append(group_starts[1:], array.size)
+    mean_ranks = (group_starts+group_ends-1)/2
+    ranks = np.empty(array.size)
+    ranks[args] = np.repeat(mean_ranks, group_ends-group_starts)
+    return ranks
@@ -0,0 +1,48 @@
+"""Compare the NumPy and numba backends on the hot paths.
+
+    python benchmarks/bench_kernels.py [n_regions]
+"""
+import sys
+import timeit
+import numpy as np
+
+from bdgtools import kernels
+from bdgtools.bedgraph import BedGraph
+from bdgtools.coverage import get_coverage
+from bdgtools.regions import Regions
+
+def setup(n_regions, size=10**8, n_runs=10**6, seed=0):
+    rng = np.random.default_rng(seed)
+    indices = np.insert(np.sort(rng.choice(np.arange(1, size), n_runs, replace=False)), 0, 0)
+    bedgraph = BedGraph(indices, rng.random(n_runs+1), size)
+    starts = np.sort(rng.integers(0, size-5000, n_regions))
+    regions = Regions(starts, starts+rng.integers(1000, 5000, n_regions), rng.choice([-1, 1], n_regions))
+    return bedgraph, regions
+
+def run(bedgraph, regions, width=1000):
+    bga = bedgraph.extract_regions(regions)
+    scaled = bga.scale_x(width)
+    diffs = np.zeros((100, width))
+    scaled.update_dense_diffs(diffs, np.arange(regions.starts.size) % 100)
+    return {"extract_regions": lambda: bedgraph.extract_regions(regions),
+            "scale_x": lambda: bga.scale_x(width),
+            "update_dense_diffs": lambda: scaled.update_dense_diffs(diffs, np.arange(regions.starts.size) % 100),
+            "col_sum": lambda: scaled.sum(axis=1),
+            "get_coverage": lambda: get_coverage(regions)}
+
+def main(n_regions=100000):
+    if kernels.numba is None:
+        sys.exit("numba is not installed")
+    bedgraph, regions = setup(n_regions)
+    timings = {}
+    for backend in (False, True):
+        kernels.set_enabled(backend)
+        for name, func in run(bedgraph, regions).items():
+            func()
+            timings.setdefault(name, []).append(min(timeit.repeat(func, number=1, repeat=5)))
+    print("%-20s %10s %10s %8s" % ("kernel", "numpy", "numba", "speedup"))
+    for name, (t_numpy, t_numba) in timings.items():
+        print("%-20s %10.4f %10.4f %7.1fx" % (name, t_numpy, t_numba, t_numpy/t_numba))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
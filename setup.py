@@ -44,6 +44,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={'jit': ['numba']},
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -57,3 +57,165 @@ def test_vplot(bedgraph, regions_10b, true_signal):
     plotter = VPlot(12, 12, do_normalize=False)
     signal = plotter([("chr1", bedgraph)], {"chr1": regions_10b})
     assert np.all(signal.iloc[10].values[1:-1]==true_signal)
+
+def test_heatplot_compact(bedgraph, regions_10b, true_matrix):
+    bedgraph = BedGraph(bedgraph._indices.astype("int32"), bedgraph._values.astype("float32"), size=50)
+    regions = Regions(regions_10b.starts.astype("int32"), regions_10b.ends.astype("int32"), regions_10b.directions)
+    plotter = HeatPlot(10, 10, do_normalize=False, aspect_ratio=3/10, dtype="float32")
+    signal = plotter([("chr1", bedgraph)], {"chr1": regions})
+    assert signal.values.dtype == np.float32
+    assert np.all(signal.values == true_matrix)
+
+def test_signalplot_compact(bedgraph, regions_10b, true_signal):
+    bedgraph = BedGraph(bedgraph._indices.astype("int32"), bedgraph._values.astype("float32"), size=50)
+    plotter = SignalPlot(10, 10, do_normalize=False, dtype="float32")
+    signal = plotter([("chr1", bedgraph)], {"chr1": regions_10b})
+    assert np.allclose(signal["y"].values, true_signal)
+
+@pytest.mark.parametrize("sort_by", ["mean", "max", "center"])
+def test_heatplot_sort_by_signal(bedgraph, regions_10b, true_matrix, sort_by):
+    plotter = HeatPlot(10, 10, do_normalize=False, aspect_ratio=3/10, sort_by=sort_by)
+    signal = plotter([("chr1", bedgraph)], {"chr1": regions_10b})
+    assert np.all(signal.values == np.array(true_matrix)[[0, 1, 2]])
+
+def test_heatplot_kmeans(bedgraph, regions_10b, true_matrix):
+    plotter = HeatPlot(10, 10, do_normalize=False, aspect_ratio=3/10, sort_by="kmeans", n_clusters=2)
+    signal = plotter([("chr1", bedgraph)], {"chr1": regions_10b})
+    assert sorted(map(tuple, signal.values)) == sorted(map(tuple, true_matrix))
+    assert np.all(signal.values[0] == true_matrix[0])
+
+def test_signalplot_bootstrap(bedgraph, regions_10b, true_signal):
+    plotter = SignalPlot(10, 10, do_normalize=False, n_bootstrap=50)
+    signal = plotter([("chr1", bedgraph)], {"chr1": regions_10b})
+    assert np.all(signal["y"].values == true_signal)
+    assert np.all(signal["lower"] <= signal["y"]) and np.all(signal["y"] <= signal["upper"])
+    assert np.all(signal["lower"] >= 0) and np.all(signal["upper"] <= 3)
+
+def _loop_interpolate(values, row_counts):
+    marked_indices = np.flatnonzero(row_counts)
+    for pre, post in zip(marked_indices[:-1], marked_indices[1:]):
+        D = post-pre
+        if D==1:
+            continue
+        values[pre:post] = ((D-np.arange(D))[:, None]*values[pre]+np.arange(D)[:, None]*values[post])/D
+    return values
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_vplot_interpolation(dtype):
+    rng = np.random.default_rng(0)
+    plotter = VPlot(10, 10, dtype=dtype)
+    plotter._row_counts = rng.integers(0, 2, 10)*rng.integers(1, 5, 10)
+    values = rng.random((10, 10)).astype(dtype)
+    assert np.array_equal(plotter._interpolate_rows(values.copy()), _loop_interpolate(values.copy(), plotter._row_counts))
+
+def test_vplot_size_bins():
+    regions = {"chr1": Regions([0, 0, 0, 0], [1, 9, 99, 1000])}
+    linear = VPlot(10, max_quantile=0.5)
+    linear._pre_process([], regions)
+    assert linear._region_size == 54
+    assert np.all(linear._get_rows(regions["chr1"].sizes()) == [0, 1, 18, 185])
+    log_bins = VPlot(10, size_bins="log")
+    log_bins._pre_process([], regions)
+    assert np.all(log_bins._get_rows(regions["chr1"].sizes()) == [0, 3, 6, 9])
+    assert np.all(log_bins.get_y_axis()[[0, 3, 6, 9]] == [1, 7, 63, 501])
+    log_bins = VPlot(10, size_bins="log")
+    log_bins._pre_process([], {"chr1": Regions([0, 0, 0], [10, 20, 1000])})
+    assert np.all(log_bins._get_rows(np.array([10, 20, 1000])) == [0, 1, 9])
+    assert log_bins.get_y_axis()[0] == 10
+
+def test_vplot_window_scale(bedgraph):
+    plotter = VPlot(10, 20, do_normalize=False, window_scale=2)
+    signal = plotter([("chr1", bedgraph)], {"chr1": Regions([20], [30])})
+    assert np.allclose(signal.columns, np.arange(-5, 5)/5)
+    assert plotter._row_counts[5] == 1
+
+def test_vplot_log_window_scale():
+    rng = np.random.default_rng(0)
+    indices = np.insert(np.cumsum(rng.integers(1, 20, 800)), 0, 0)
+    bedgraph = BedGraph(indices, rng.integers(0, 10, indices.size), size=indices[-1]+1)
+    sizes = rng.integers(5, 300, 40)
+    mids = 1000+np.arange(40)*200
+    regions = Regions(mids-sizes//2, mids-sizes//2+sizes, rng.choice([-1, 1], 40))
+    plotter = VPlot(10, do_normalize=False, size_bins="log", window_scale=2)
+    table = plotter([("chr1", bedgraph)], {"chr1": regions})
+    n_rows = 10
+    edges = sizes.min()*((sizes.max()+1)/sizes.min())**(np.arange(n_rows+1)/n_rows)
+    rows = np.searchsorted(edges, sizes, side="right")-1
+    assert np.all(plotter._get_rows(sizes) == rows)
+    assert table.index[0] == sizes.min()
+    half_windows = np.maximum(np.ceil(2*edges[rows+1]).astype(int)//2, 1)
+    region_mids = (regions.starts+regions.ends)//2
+    windows = Regions(region_mids-half_windows, region_mids+half_windows, regions.directions)
+    dense = windows.get_signals(bedgraph).scale_x(10).to_dense()
+    for row in np.unique(rows):
+        assert np.allclose(table.values[row], dense[rows == row].mean(axis=0))
+
+def test_stranded_plot():
+    plus = BedGraph([0, 10, 20], [0, 1, 0], size=40)
+    minus = BedGraph([0, 5, 15], [0, 2, 0], size=40)
+    regions = {"chr1": Regions([8, 4], [12, 16], [1, -1])}
+    sense, antisense = StrandedPlot(TSSPlot, 4, 4, do_normalize=False)(
+        [("chr1", plus)], [("chr1", minus)], regions)
+    true_sense = TSSPlot(4, 4, do_normalize=False)([("chr1", plus)], {"chr1": regions["chr1"][[0]]})["y"].values
+    true_sense = (true_sense + TSSPlot(4, 4, do_normalize=False)([("chr1", minus)], {"chr1": regions["chr1"][[1]]})["y"].values)/2
+    assert np.allclose(sense["y"].values, true_sense)
+    true_antisense = TSSPlot(4, 4, do_normalize=False)([("chr1", minus)], {"chr1": regions["chr1"][[0]]})["y"].values
+    true_antisense = (true_antisense + TSSPlot(4, 4, do_normalize=False)([("chr1", plus)], {"chr1": regions["chr1"][[1]]})["y"].values)/2
+    assert np.allclose(antisense["y"].values, true_antisense)
+
+@pytest.mark.parametrize("minus_bedgraphs", [[("chr1", BedGraph([0], [1], size=40))],
+                                             [("chr2", BedGraph([0], [1], size=40)), ("chr1", BedGraph([0], [1], size=40))],
+                                             [("chr1", BedGraph([0], [1], size=40)), ("chr2", BedGraph([0], [1], size=30))]])
+def test_stranded_plot_mismatch(minus_bedgraphs):
+    plus_bedgraphs = [("chr1", BedGraph([0, 10], [0, 1], size=40)), ("chr2", BedGraph([0], [1], size=40))]
+    regions = {"chr1": Regions([8], [12], [1]), "chr2": Regions([8], [12], [-1])}
+    with pytest.raises(ValueError):
+        StrandedPlot(TSSPlot, 4, 4, do_normalize=False)(plus_bedgraphs, minus_bedgraphs, regions)
+
+@pytest.mark.parametrize("plot_class, kwargs", [(TSSPlot, {}), (AveragePlot, {}), (VPlot, {}),
+                                                (HeatPlot, {"aspect_ratio": 1}),
+                                                (HeatPlot, {"aspect_ratio": 1, "sort_by": "max"})])
+@pytest.mark.parametrize("max_memory", [1, 64*200])
+def test_batched_plot(plot_class, kwargs, max_memory):
+    rng = np.random.default_rng(0)
+    indices = np.insert(np.cumsum(rng.integers(1, 20, 500)), 0, 0)
+    bedgraph = BedGraph(indices, rng.integers(0, 10, indices.size), size=indices[-1]+1)
+    starts = np.sort(rng.integers(200, indices[-1]-400, 40))
+    regions = {"chr1": Regions(starts, starts+rng.integers(10, 200, 40), rng.choice([-1, 1], 40))}
+    plotter = plot_class(20, 200, max_memory=max_memory, **kwargs)
+    assert len(plotter._get_batches(bedgraph, plotter._transform_regions(regions["chr1"]))) > 1
+    batched = plotter([("chr1", bedgraph)], regions)
+    assert batched.equals(plot_class(20, 200, **kwargs)([("chr1", bedgraph)], regions))
+
+@pytest.fixture
+def differential_data():
+    rng = np.random.default_rng(0)
+    indices = np.insert(np.cumsum(rng.integers(1, 20, 500)), 0, 0)
+    control = BedGraph(indices, rng.integers(0, 10, indices.size), size=indices[-1]+1)
+    treatment = BedGraph(indices, control._values+2, size=indices[-1]+1)
+    starts = np.sort(rng.integers(200, indices[-1]-400, 30))
+    return treatment, control, {"chr1": Regions(starts, starts+1, rng.choice([-1, 1], 30))}
+
+@pytest.mark.parametrize("method", ["permutation", "bootstrap"])
+def test_differential_plot(differential_data, method):
+    treatment, control, regions = differential_data
+    table = DifferentialPlot(TSSPlot, 10, 100, do_normalize=False, method=method, n_resamples=200)(
+        [("chr1", treatment)], [("chr1", control)], regions)
+    control_table = TSSPlot(10, 100, do_normalize=False)([("chr1", control)], regions)
+    assert np.allclose(table["control"], control_table["y"])
+    assert np.allclose(table["y"], 2)
+    assert np.allclose(table["log2ratio"], np.log2((table["control"]+3)/(table["control"]+1)))
+    assert np.all(table["pvalue"] <= 1/201)
+
+def test_differential_plot_mismatch(differential_data):
+    treatment, control, regions = differential_data
+    with pytest.raises(ValueError):
+        DifferentialPlot(TSSPlot, 10, 100)([("chr1", treatment), ("chr2", treatment)], [("chr1", control)], regions)
+    with pytest.raises(ValueError):
+        DifferentialPlot(TSSPlot, 10, 100)([("chr1", treatment)], [("chr2", control)], regions)
+
+def test_differential_plot_null(differential_data):
+    _, control, regions = differential_data
+    table = DifferentialPlot(TSSPlot, 10, 100, n_resamples=50)([("chr1", control)], [("chr1", control)], regions)
+    assert np.all(table["y"] == 0)
+    assert np.all(table["pvalue"] == 1)
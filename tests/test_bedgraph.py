@@ -61,3 +61,49 @@ def test_extract_regions_bga(bedgraph, regions):
     regions.directions=np.array([1,1,1], dtype="int")
     bga = BedGraphArray.from_bedgraphs([bedgraph]*3)
     assert bga.extract_regions(regions)==bedgraph.extract_regions(regions)
+
+def test_threshold_starts_above():
+    bg = BedGraph([0, 10, 15, 25, 40], [5, 1, 2, 3, 4], size=50)
+    assert bg.threshold(2) == Regions([0, 15], [10, 50])
+
+def test_scale_x_int32_overflow():
+    bga = BedGraphArray(np.array([0, 2**30], dtype="int32"), [1, 2], [2**31-1], [0, 2])
+    scaled = bga.scale_x(4)
+    assert scaled._indices.dtype == np.int32
+    assert list(scaled._indices) == [0, 2]
+
+def test_row_reductions(bedgrapharray):
+    assert list(bedgrapharray.row_sums()) == [5, 105]
+    assert list(bedgrapharray.row_max()) == [1, 4]
+    assert list(bedgrapharray.get_column(10)) == [1, 3]
+    assert np.allclose(bedgrapharray.row_means(), [1/3, 3])
+    assert list(bedgrapharray.row_argmax()) == [10, 25]
+    assert list(bedgrapharray.row_coverage()) == [5, 35]
+    assert list(bedgrapharray.row_coverage(2.5)) == [0, 25]
+    assert bedgrapharray.sum() == 110
+    assert bedgrapharray.mean() == 2.2
+
+def test_row_argmax_ties():
+    bga = BedGraphArray([0, 5, 7, 0], [3, 1, 3, 2], [10, 4], [0, 3, 4])
+    assert list(bga.row_argmax()) == [0, 0]
+
+def test_row_selection(bedgrapharray):
+    bga = BedGraphArray.vstack((bedgrapharray, bedgrapharray))
+    row = bga[3]
+    assert row == BedGraph([0, 10, 25], [2, 3, 4], 35)
+    assert np.shares_memory(row._values, bga._values)
+    assert bga[-1] == row
+    assert bga[1:3] == BedGraphArray([0, 10, 25, 0, 10], [2, 3, 4, 0, 1], [35, 15], [0, 3, 5])
+    assert bga[[3, 0]] == BedGraphArray([0, 10, 25, 0, 10], [2, 3, 4, 0, 1], [35, 15], [0, 3, 5])
+    assert bga[np.array([True, False, False, True])] == BedGraphArray([0, 10, 0, 10, 25], [0, 1, 2, 3, 4], [15, 35], [0, 2, 5])
+    assert len(bga[np.zeros(4, dtype=bool)]) == 0
+
+def test_range_sums(bedgraph):
+    assert list(bedgraph.range_sums(np.array([0, 12, 30]), np.array([50, 17, 45]))) == [110, 7, 50]
+
+def test_range_coverage(bedgraph):
+    assert list(bedgraph.range_coverage(np.array([0, 5]), np.array([50, 12]))) == [40, 2]
+
+def test_region_means(bedgraph, regions):
+    means = bedgraph.region_means(regions)
+    assert np.allclose(means, [s.sum()/s._size for s in bedgraph.extract_regions(regions)])
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bdgtools.cache import ResultCache
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / "track.bdg"
+    path.write_text("chr1\t0\t10\t1\n")
+    return str(path)
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({"x": np.arange(3), "y": np.ones(3)})
+
+def test_cache_roundtrip(tmp_path, input_file, table):
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.get_key([input_file], plot="TSSPlot", width=10)
+    assert cache.get(key) is None
+    cache.put(key, table)
+    assert cache.get(key).equals(table)
+
+def test_cache_key(tmp_path, input_file):
+    cache = ResultCache(tmp_path / "cache", hash_contents=True)
+    key = cache.get_key([input_file], plot="TSSPlot", width=10)
+    assert key == cache.get_key([input_file], width=10, plot="TSSPlot")
+    assert key != cache.get_key([input_file], plot="TSSPlot", width=20)
+    with open(input_file, "a") as f:
+        f.write("chr1\t10\t20\t2\n")
+    assert key != cache.get_key([input_file], plot="TSSPlot", width=10)
+
+def test_cache_eviction(tmp_path, input_file, table):
+    cache = ResultCache(tmp_path / "cache", max_size=1)
+    cache.put("a", table)
+    assert cache.get("a") is None
+
+def test_cached_plot_skips_stdin(tmp_path):
+    from click.testing import CliRunner
+    from bdgtools.cli import do_plot
+    track = tmp_path / "track.bdg"
+    track.write_text("chr1\t0\t30\t1\nchr1\t30\t100\t2\n")
+    result = CliRunner().invoke(do_plot, ["tss", str(track), "-", "-w", "10", "-rs", "20", "-od", str(tmp_path / "out.pkl"),
+                                          "--cache-dir", str(tmp_path / "cache")], input="chr1\t40\t50\t.\t.\t+\n")
+    assert result.exit_code == 0, result.output
+    assert not (tmp_path / "cache").exists()
@@ -0,0 +1,28 @@
+import gzip
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET = 0.5
+
+def _run_python(code):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+def test_cli_import_is_lazy():
+    loaded = _run_python("import sys, bdgtools.cli; print(*(m in sys.modules for m in ('pandas', 'matplotlib', 'seaborn')))")
+    assert loaded == ["False", "False", "False"]
+
+def test_cli_import_time():
+    t = _run_python("import time; t=time.perf_counter(); import bdgtools.cli; print(time.perf_counter()-t)")
+    assert float(t[0]) < IMPORT_TIME_BUDGET
+
+def test_bed2bdg_skips_plotting(tmp_path):
+    bedfile = tmp_path / "reads.bed.gz"
+    with gzip.open(bedfile, "wt") as f:
+        f.write("chr1\t2\t5\nchr1\t3\t7\n")
+    outfile = tmp_path / "out.bdg"
+    code = ("import sys; from bdgtools.cli import main\n"
+            f"main(['bed2bdg', '{bedfile}', '-o', '{outfile}'], standalone_mode=False)\n"
+            "print('matplotlib' in sys.modules)")
+    assert _run_python(code) == ["False"]
+    assert outfile.read_text().split("\n")[:3] == ["chr1\t0\t2\t0", "chr1\t2\t3\t1", "chr1\t3\t5\t2"]
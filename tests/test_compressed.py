@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from bdgtools.bedgraph import BedGraph
+from bdgtools.compressed import CompressedBedGraph
+from bdgtools.regions import Regions
+
+@pytest.fixture
+def bedgraph():
+    rng = np.random.default_rng(0)
+    deltas = rng.integers(1, 300, 1000)
+    deltas[[100, 500]] = 100000
+    indices = np.insert(np.cumsum(deltas), 0, 0)
+    return BedGraph(indices, rng.integers(0, 20, indices.size).astype(float), indices[-1]+10)
+
+@pytest.fixture
+def regions(bedgraph):
+    rng = np.random.default_rng(1)
+    starts = np.sort(rng.integers(0, bedgraph._size-5000, 50))
+    return Regions(starts, starts+rng.integers(1, 5000, 50), rng.choice([-1, 1], 50))
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, 5000])
+def test_roundtrip(bedgraph, block_size):
+    compressed = CompressedBedGraph(bedgraph, block_size=block_size)
+    assert compressed.to_bedgraph() == bedgraph
+    assert compressed.sum() == bedgraph.sum()
+
+@pytest.mark.parametrize("block_size", [1, 7, 64])
+def test_extract_regions(bedgraph, regions, block_size):
+    compressed = CompressedBedGraph(bedgraph, block_size=block_size)
+    assert compressed.extract_regions(regions) == bedgraph.extract_regions(regions)
+
+def test_getslice(bedgraph):
+    compressed = CompressedBedGraph(bedgraph, block_size=16)
+    for start, stop in [(0, 10), (1000, 60000), (150000, bedgraph._size)]:
+        assert compressed[start:stop] == bedgraph[start:stop]
+
+def test_compression(bedgraph):
+    compressed = CompressedBedGraph(bedgraph, block_size=64)
+    assert compressed._levels.size == 20
+    assert compressed.nbytes*4 < bedgraph._indices.nbytes + bedgraph._values.nbytes
+
+def test_quantize(bedgraph):
+    values = np.random.default_rng(2).random(bedgraph._values.size)
+    bedgraph = BedGraph(bedgraph._indices, values, bedgraph._size)
+    assert CompressedBedGraph(bedgraph, max_levels=16)._levels is None
+    compressed = CompressedBedGraph(bedgraph, max_levels=256, quantize=True)
+    assert np.allclose(compressed.to_bedgraph()._values, values, atol=1/255)
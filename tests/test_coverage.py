@@ -1,8 +1,9 @@
 import pytest
+import numpy as np
 
 from bdgtools.regions import Regions
 from bdgtools.bedgraph import BedGraph
-from bdgtools.coverage import get_coverage
+from bdgtools.coverage import get_coverage, get_binned_coverage
 
 @pytest.fixture
 def regions():
@@ -17,3 +18,32 @@ def bedgraph():
 def test_get_coverage(regions, bedgraph):
     print(get_coverage(regions))
     assert get_coverage(regions) == bedgraph
+
+@pytest.mark.parametrize("binsize", [1, 3, 10])
+def test_get_binned_coverage(binsize):
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, 200, 100)
+    regions = Regions(starts, starts+rng.integers(1, 30, 100))
+    n_bins = 230//binsize
+    dense = np.zeros(n_bins*binsize+30)
+    for start, end in zip(regions.starts, regions.ends):
+        dense[start:end] += 1
+    dense = dense[:n_bins*binsize].reshape(n_bins, binsize)
+    assert np.allclose(get_binned_coverage(regions, binsize, "mean", n_bins*binsize), dense.mean(axis=1))
+    assert np.all(get_binned_coverage(regions, binsize, "max", n_bins*binsize) == dense.max(axis=1))
+    bin_starts = np.arange(n_bins)*binsize
+    counts = [np.sum((regions.starts < s+binsize) & (regions.ends > s)) for s in bin_starts]
+    assert np.all(get_binned_coverage(regions, binsize, "count", n_bins*binsize) == counts)
+    assert get_binned_coverage(regions, binsize).size == -(-regions.ends.max()//binsize)
+
+@pytest.mark.parametrize("size", [95, 101, 117])
+def test_get_binned_coverage_partial_bin(size):
+    rng = np.random.default_rng(1)
+    starts = rng.integers(0, 110, 50)
+    regions = Regions(starts, starts+rng.integers(1, 30, 50))
+    dense = np.zeros(200)
+    for start, end in zip(regions.starts, regions.ends):
+        dense[start:end] += 1
+    bins = [dense[start:min(start+10, size)] for start in range(0, size, 10)]
+    assert np.allclose(get_binned_coverage(regions, 10, "mean", size), [b.mean() for b in bins])
+    assert np.all(get_binned_coverage(regions, 10, "max", size) == [b.max() for b in bins])
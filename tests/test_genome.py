@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from bdgtools import BedGraph, Regions
+from bdgtools.genome import Genome
+from bdgtools.aggregateplot import SignalPlot, HeatPlot, TSSPlot, VPlot
+from .fixtures import bedgraph, regions_10b
+
+@pytest.fixture
+def chrom_sizes():
+    return {"chr1": 50, "chr2": 60, "chr3": 10}
+
+@pytest.fixture
+def bedgraphs(bedgraph):
+    return [("chr1", bedgraph), ("chr2", BedGraph([0, 5, 30], [2, 0, 1], size=40))]
+
+@pytest.fixture
+def regions(regions_10b):
+    return {"chr1": regions_10b, "chr2": Regions([10, 28], [20, 38], [1, -1])}
+
+def test_flatten_bedgraphs(chrom_sizes, bedgraphs):
+    flat = Genome(chrom_sizes, padding=5).flatten_bedgraphs(bedgraphs)
+    assert flat == BedGraph([0, 5, 15, 20, 30, 45, 55, 60, 65, 90, 100],
+                            [0, 0, 1, 2, 3, 4, 0, 2, 0, 1, 0], size=140)
+
+def test_flatten_regions(chrom_sizes, regions):
+    flat = Genome(chrom_sizes, padding=5).flatten_regions(regions)
+    assert flat == Regions([7, 18, 22, 70, 88], [17, 28, 32, 80, 98], [1, -1, 1, 1, -1])
+
+@pytest.mark.parametrize("plot_cls", [SignalPlot, HeatPlot, VPlot])
+def test_call_flat(plot_cls, chrom_sizes, bedgraphs, regions):
+    kwargs = {"aspect_ratio": 1/2} if plot_cls is HeatPlot else {}
+    flat = plot_cls(12, 12, **kwargs).call_flat(bedgraphs, regions, chrom_sizes)
+    per_chrom = plot_cls(12, 12, **kwargs)(bedgraphs, regions)
+    assert np.allclose(flat.values, per_chrom.values)
+
+def test_call_flat_chromosome_border(chrom_sizes, bedgraphs):
+    regions = {"chr1": Regions([46], [47]), "chr2": Regions([1], [2])}
+    signal = TSSPlot(10, 10, do_normalize=False).call_flat(bedgraphs, regions, chrom_sizes)
+    true = (np.array([4, 4, 4, 4, 4, 4, 4, 4, 4, 0]) + np.array([0, 0, 0, 0, 2, 2, 2, 2, 2, 0]))/2
+    assert np.all(signal["y"].values == true)
+
+@pytest.mark.parametrize("plot_cls", [SignalPlot, VPlot])
+def test_call_flat_missing_track(plot_cls, chrom_sizes, bedgraphs, regions):
+    regions = dict(regions, chr3=Regions([2], [8]))
+    flat_plot, per_chrom_plot = (plot_cls(12, 12), plot_cls(12, 12))
+    flat = flat_plot.call_flat(bedgraphs, regions, chrom_sizes)
+    per_chrom = per_chrom_plot(bedgraphs, regions)
+    assert np.all(flat_plot._row_counts == per_chrom_plot._row_counts)
+    assert np.allclose(flat.values, per_chrom.values)
@@ -1,6 +1,9 @@
 import io
+import pytest
+import numpy as np
 
-from bdgtools.io import read_bedgraph, read_bedfile, read_refseq
+from bdgtools.io import read_bedgraph, read_bedfile, read_refseq, read_large_bedfile, read_fragments, write_bedgraph, write_bedfile, write_fixed_step, prefetch, zip_bedgraphs
+from bdgtools.peakcalling import Peaks
 from bdgtools import BedGraph, Regions
 from bdgtools.splitregions import Genes
 
@@ -63,3 +66,125 @@ def test_read_genes():
     true_genes = Genes(Regions(exon_starts, exon_ends, [1]*4+[-1]*4), [0, 4, 8],
                        coding_regions=Regions(cd_starts, cd_ends))
     assert genes == true_genes
+
+def test_prefetch():
+    assert list(prefetch(iter(range(10)), 2)) == list(range(10))
+    assert list(prefetch(iter(range(10)), 0)) == list(range(10))
+
+def test_prefetch_error():
+    def failing():
+        yield 1
+        raise ValueError("bad chromosome")
+    with pytest.raises(ValueError):
+        list(prefetch(failing(), 2))
+
+def test_prefetch_bedgraph():
+    lines = ["chr1\t0\t10\t0",
+             "chr1\t10\t25\t1",
+             "chr2\t0\t5\t0",
+             "chr2\t5\t10\t2"]
+    bedgraphs = list(prefetch(read_bedgraph(io.StringIO("\n".join(lines))), 1))
+    assert bedgraphs == [("chr1", BedGraph([0, 10], [0, 1])),
+                         ("chr2", BedGraph([0, 5], [0, 2]))]
+
+def test_read_unsorted_bedfile():
+    lines = ["chr2\t5\t10\t.\t.\t+",
+             "chr1\t10\t25\t.\t.\t-",
+             "chr2\t0\t5\t.\t.\t-",
+             "chr1\t0\t10\t.\t.\t+"]
+    bedfile = read_bedfile(io.StringIO("\n".join(lines)))
+    assert bedfile == {"chr1": Regions([0, 10], [10, 25], [1, -1]),
+                       "chr2": Regions([0, 5], [5, 10], [-1, 1])}
+    assert bedfile["chr1"].directions.dtype == np.int8
+
+def test_read_large_bedfile_chunks():
+    lines = ["chr1\t0\t10\t.\t.\t+",
+             "chr1\t10\t25\t.\t.\t-",
+             "chr1\t25\t35\t.\t.\t+",
+             "chr2\t0\t5\t.\t.\t-"]
+    bedfile = list(read_large_bedfile(io.StringIO("\n".join(lines)), size_hint=2))
+    assert bedfile == [("chr1", Regions([0, 10, 25], [10, 25, 35], [1, -1, 1])),
+                       ("chr2", Regions([0], [5], [-1]))]
+
+def test_read_bedgraph_chunks():
+    lines = ["chr1\t0\t10\t0",
+             "chr1\t10\t25\t1",
+             "chr1\t25\t35\t10",
+             "chr2\t0\t5\t0",
+             "chr2\t5\t10\t2"]
+    bedgraphs = list(read_bedgraph(io.StringIO("\n".join(lines)), size_hint=2))
+    assert bedgraphs == [("chr1", BedGraph([0, 10, 25], [0, 1, 10])),
+                         ("chr2", BedGraph([0, 5], [0, 2]))]
+
+def test_write_bedgraph():
+    f = io.StringIO()
+    write_bedgraph([("chr1", BedGraph([0, 10, 25], [0, 1, 10], size=35))], f)
+    assert f.getvalue().split("\n") == ["chr1\t0\t10\t0", "chr1\t10\t25\t1", "chr1\t25\t35\t10", ""]
+
+def test_read_fragments_bedpe():
+    lines = ["chr2\t10\t20\tchr2\t40\t50\tr1\t0\t+\t-",
+             "chr1\t30\t40\tchr1\t5\t15\tr2\t0\t-\t+",
+             "chr1\t0\t10\tchr2\t5\t15\tr3\t0\t+\t-",
+             "chr2\t60\t70\tchr2\t0\t5\tr5\t0\t-\t+",
+             "chr1\t2\t12\tchr1\t20\t25\tr4\t0\t+\t-"]
+    for size_hint in (1, 2, 10):
+        fragments = list(read_fragments(io.StringIO("\n".join(lines)), size_hint=size_hint))
+        assert fragments == [("chr1", Regions([2, 5], [25, 40], [1, -1])),
+                             ("chr2", Regions([0, 10], [70, 50], [-1, 1]))]
+
+def test_read_fragments_paired_bed():
+    lines = ["chr1\t3\t12\tr3/1\t0\t+",
+             "chr1\t5\t15\tr1/2\t0\t+",
+             "chr1\t0\t10\tr2/1\t0\t+",
+             "chr1\t20\t30\tr3/2\t0\t-",
+             "chr1\t30\t40\tr1/1\t0\t-",
+             "chr1\t31\t41\tr4/1\t0\t+",
+             "chr1\t32\t42\tr4/2\t0\t-",
+             "chr1\t33\t43\tr4/2\t0\t-",
+             "chr2\t0\t10\tr5/1\t0\t+",
+             "chr2\t20\t30\tr5/2\t0\t-"]
+    for size_hint in (1, 2, 3, 10):
+        fragments = list(read_fragments(io.StringIO("\n".join(lines)), size_hint=size_hint, paired_bed=True))
+        assert fragments == [("chr1", Regions([3, 5, 31], [30, 40, 42], [1, -1, 1])),
+                             ("chr2", Regions([0], [30], [1]))]
+
+def test_read_fragments_name_sorted():
+    lines = ["chr1\t0\t10\tr1/1\t0\t+",
+             "chr1\t20\t30\tr1/2\t0\t-",
+             "chr2\t5\t15\tr2/1\t0\t-",
+             "chr2\t0\t8\tr2/2\t0\t+",
+             "chr1\t40\t50\tr3/1\t0\t+",
+             "chr1\t2\t12\tr3/2\t0\t-"]
+    for size_hint in (1, 2, 3, 10):
+        fragments = list(read_fragments(io.StringIO("\n".join(lines)), size_hint=size_hint, paired_bed=True))
+        assert fragments == [("chr1", Regions([0, 2], [30, 50], [1, 1])),
+                             ("chr2", Regions([0], [15], [-1]))]
+    bedpe = ["chr1\t0\t10\tchr1\t20\t30\tr1\t0\t+\t-",
+             "chr2\t5\t15\tchr2\t0\t8\tr2\t0\t-\t+",
+             "chr1\t40\t50\tchr1\t2\t12\tr3\t0\t+\t-"]
+    assert list(read_fragments(io.StringIO("\n".join(bedpe)), size_hint=1)) == fragments
+
+def test_write_fixed_step():
+    f = io.StringIO()
+    write_fixed_step([("chr1", 20, np.array([0.5, 2])), ("chr2", 25, np.array([3, 4, 5])), ("chr3", 7, np.array([1]))], 10, f)
+    assert f.getvalue().split("\n") == ["fixedStep chrom=chr1 start=1 step=10 span=10", "0.5", "2.0",
+                                        "fixedStep chrom=chr2 start=1 step=10 span=10", "3", "4",
+                                        "fixedStep chrom=chr2 start=21 step=10 span=5", "5",
+                                        "fixedStep chrom=chr3 start=1 step=10 span=7", "1", ""]
+
+def test_write_peaks_roundtrip():
+    f = io.StringIO()
+    write_bedfile({"chr1": Peaks([0, 40], [30, 50], [6, 3], [17, 45], [121, 30])}, f)
+    assert f.getvalue().split("\n")[0].split("\t") == ["chr1", "0", "30", "peak_1", "6", ".", "121", "-1", "-1", "17"]
+    f.seek(0)
+    assert read_bedfile(f) == {"chr1": Regions([0, 40], [30, 50], [1, 1])}
+
+def test_zip_bedgraphs():
+    a, b = (BedGraph([0], [1], 10), BedGraph([0], [2], 10))
+    assert [chrom for chrom, _ in zip_bedgraphs([("chr1", a), ("chr2", a)], [("chr1", b), ("chr2", b)])] == ["chr1", "chr2"]
+    with pytest.raises(ValueError):
+        list(zip_bedgraphs([("chr1", a), ("chr2", a)], [("chr1", b)]))
+    with pytest.raises(ValueError):
+        list(zip_bedgraphs([("chr1", a)], [("chr1", b), ("chr2", b)]))
+    with pytest.raises(ValueError):
+        list(zip_bedgraphs([("chr1", a)], [("chr2", b)]))
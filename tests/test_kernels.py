@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from bdgtools import kernels
+from bdgtools.bedgraph import BedGraph, BedGraphArray
+from bdgtools.coverage import get_coverage, _get_coverage_jit
+from bdgtools.regions import Regions
+
+@pytest.fixture(autouse=True)
+def numpy_backend(monkeypatch):
+    monkeypatch.setattr(kernels, "enabled", False)
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1)
+
+def random_bedgraph(rng, size=1000, n=100):
+    indices = np.insert(np.sort(rng.choice(np.arange(1, size), n, replace=False)), 0, 0)
+    return BedGraph(indices, rng.integers(0, 10, n+1), size)
+
+def random_regions(rng, size=1000, n=50):
+    starts = np.sort(rng.integers(0, size-100, n))
+    ends = starts + rng.integers(1, 100, n)
+    return Regions(starts, ends, rng.choice([-1, 1], n))
+
+def test_extract_regions(rng):
+    bedgraph = random_bedgraph(rng)
+    regions = random_regions(rng)
+    start_idxs = np.searchsorted(bedgraph._indices, regions.starts, side="right")-1
+    end_idxs = np.searchsorted(bedgraph._indices, regions.ends, side="left")
+    offsets = np.insert(np.cumsum(end_idxs-start_idxs), 0, 0)
+    assert bedgraph._extract_regions_jit(regions, start_idxs, offsets) == bedgraph.extract_regions(regions)
+
+@pytest.mark.parametrize("size", [7, 30, 200])
+def test_scale_x(rng, size):
+    bga = random_bedgraph(rng).extract_regions(random_regions(rng))
+    assert bga._scale_x_jit(size) == bga.scale_x(size)
+
+def test_update_dense_diffs(rng):
+    bga = random_bedgraph(rng).extract_regions(random_regions(rng)).scale_x(40)
+    rows = rng.integers(0, 5, bga._sizes.size)
+    diffs = np.zeros((5, 40))
+    bga.update_dense_diffs(diffs, rows)
+    jit_diffs = np.zeros((5, 40))
+    kernels.update_dense_diffs(bga._indices, bga._values, bga._offsets, rows, jit_diffs)
+    assert np.allclose(np.cumsum(jit_diffs, axis=1), np.cumsum(diffs, axis=1))
+
+def test_col_sum(rng):
+    bga = random_bedgraph(rng).extract_regions(random_regions(rng)).scale_x(40)
+    assert bga._col_sum_jit() == bga._col_sum()
+
+def test_coverage(rng):
+    regions = random_regions(rng)
+    assert _get_coverage_jit(regions) == get_coverage(regions)
+
+def test_numba_backend(rng):
+    pytest.importorskip("numba")
+    bga = random_bedgraph(rng).extract_regions(random_regions(rng))
+    reference = bga.scale_x(40).sum(axis=1)
+    kernels.set_enabled(True)
+    assert bga.scale_x(40).sum(axis=1) == reference
@@ -0,0 +1,26 @@
+import numpy as np
+
+from bdgtools import Regions
+from bdgtools.matrix import compute_matrix, get_region_table
+from .fixtures import bedgraph, regions_10b
+
+def test_compute_matrix(bedgraph, regions_10b, tmp_path):
+    regions = {"chr1": regions_10b, "chr2": Regions([0], [10])}
+    path = tmp_path / "matrix.npy"
+    compute_matrix([("chr1", bedgraph)], regions, path, 10, batch_size=2)
+    true = [[0,0,0,0,0,0,0,0,1,1],
+            [2,2,2,2,2,2,2,2,1,1],
+            [2,2,2,2,2,2,2,2,3,3],
+            [0,0,0,0,0,0,0,0,0,0]]
+    assert np.all(np.load(path) == true)
+
+def test_compute_matrix_region_size(bedgraph, regions_10b, tmp_path):
+    path = tmp_path / "matrix.npy"
+    compute_matrix([("chr1", bedgraph)], {"chr1": regions_10b}, path, 5, region_size=4)
+    assert np.all(np.load(path) == [[0,0,0,0,0], [2,2,2,2,2], [2,2,2,2,2]])
+
+def test_region_table(regions_10b):
+    table = get_region_table({"chr1": regions_10b, "chr2": Regions([0], [10])})
+    assert list(table["chrom"]) == ["chr1"]*3 + ["chr2"]
+    assert list(table["strand"]) == ["+", "-", "+", "+"]
+    assert list(table["row"]) == [0, 1, 2, 3]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from bdgtools import BedGraph
+from bdgtools.peakcalling import call_peaks, Peaks
+
+@pytest.fixture
+def bedgraph():
+    return BedGraph([0, 10, 15, 20, 22, 30, 40], [5, 1, 6, 2, 4, 0, 3], size=50)
+
+def test_call_peaks(bedgraph):
+    peaks = call_peaks(bedgraph, 3)
+    assert peaks == Peaks([0, 15, 22, 40], [10, 20, 30, 50], [5, 6, 4, 3], [5, 17, 26, 45], [50, 30, 32, 30])
+
+def test_call_peaks_merge(bedgraph):
+    peaks = call_peaks(bedgraph, 3, max_gap=5)
+    assert peaks == Peaks([0, 40], [30, 50], [6, 3], [17, 45], [121, 30])
+
+def test_call_peaks_min_length(bedgraph):
+    peaks = call_peaks(bedgraph, 3, min_length=10)
+    assert peaks == Peaks([0, 40], [10, 50], [5, 3], [5, 45], [50, 30])
+
+def test_call_peaks_background(bedgraph):
+    peaks = call_peaks(bedgraph, 1, background_window=20, fold=1.2)
+    assert np.all(peaks.starts == [0, 15, 22, 40])
+    assert np.all(peaks.ends == [10, 20, 30, 50])
+
+def test_call_peaks_empty(bedgraph):
+    peaks = call_peaks(bedgraph, 10)
+    assert peaks.starts.size == 0
+
+def test_peaks_getitem(bedgraph):
+    peaks = call_peaks(bedgraph, 3)
+    assert peaks[[1, 3]] == Peaks([15, 40], [20, 50], [6, 3], [17, 45], [30, 30])
+    assert peaks[1:3] == Peaks([15, 22], [20, 30], [6, 4], [17, 26], [30, 32])
+
+def test_batched_plot_peaks():
+    from bdgtools.aggregateplot import VPlot
+    bedgraph = BedGraph([0, 30, 40, 45, 50, 52, 60, 70, 100], [0, 5, 1, 6, 2, 4, 0, 3, 0], size=130)
+    peaks = {"chr1": call_peaks(bedgraph, 3)}
+    plot = VPlot(10, 40, max_memory=1)
+    assert len(plot._get_batches(bedgraph, peaks["chr1"])) > 1
+    assert plot([("chr1", bedgraph)], peaks).equals(VPlot(10, 40)([("chr1", bedgraph)], peaks))
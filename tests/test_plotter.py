@@ -0,0 +1,44 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+import pytest
+
+from bdgtools.aggregateplot import HeatPlot
+from bdgtools.plotter import plot_matrix, render_batch
+
+@pytest.fixture
+def table():
+    df = pd.DataFrame(np.arange(12, dtype="float").reshape(3, 4))
+    df.index = np.arange(3)+1
+    df.columns = np.arange(-2, 2)*10
+    return df
+
+def test_plot_matrix(table):
+    ax = plot_matrix(table)
+    image = ax.get_images()[0]
+    assert image.get_array().shape == (3, 4)
+    assert image.get_extent() == [-20, 20, 2.5, -0.5]
+    assert [t.get_text() for t in ax.get_yticklabels()] == ["1", "2", "3"]
+
+def test_plot_matrix_uneven_index(table):
+    table.index = [3, 10, 200]
+    ax = plot_matrix(table)
+    assert list(ax.get_yticks()) == [0, 1, 2]
+    assert [t.get_text() for t in ax.get_yticklabels()] == ["3", "10", "200"]
+
+def test_render_batch(table, tmp_path):
+    data_files = [tmp_path / "a.pkl", tmp_path / "b.pkl"]
+    for data_file in data_files:
+        table.to_pickle(data_file)
+    save_paths = [str(tmp_path / "a.png"), str(tmp_path / "b.png")]
+    assert render_batch(data_files, HeatPlot, save_paths, processes=2) == save_paths
+    assert render_batch(data_files, HeatPlot, save_paths, processes=2, raw=True) == save_paths
+    assert all((tmp_path / name).stat().st_size > 0 for name in ("a.png", "b.png"))
+
+def test_plot_matrix_heat_index():
+    index = np.cumsum(np.arange(40)**2)
+    ax = plot_matrix(pd.DataFrame(np.ones((40, 5)), index=index))
+    rows = ax.get_yticks().astype(int)
+    assert rows[0] == 0 and rows[-1] == 39
+    assert [t.get_text() for t in ax.get_yticklabels()] == [str(index[row]) for row in rows]
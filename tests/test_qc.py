@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from bdgtools import BedGraph
+from bdgtools.qc import TrackQC
+from .fixtures import bedgraph
+
+@pytest.fixture
+def other():
+    return BedGraph([0, 5, 20, 30], [1, 0, 3, 2], size=45)
+
+def _dense(bg, size):
+    d = np.repeat(bg._values, np.diff(bg._indices, append=bg._size))
+    return np.append(d, np.zeros(size-d.size))
+
+def test_pearson(bedgraph, other):
+    qc = TrackQC(["a", "b"])
+    qc.update("chr1", [bedgraph, other])
+    qc.update("chr2", [other, bedgraph])
+    a = np.concatenate((_dense(bedgraph, 50), _dense(other, 50)))
+    b = np.concatenate((_dense(other, 50), _dense(bedgraph, 50)))
+    assert np.isclose(qc.pearson().loc["a", "b"], np.corrcoef(a, b)[0, 1])
+
+def test_spearman(bedgraph, other):
+    qc = TrackQC(["a", "b"], binsize=5, keep_bins=True)
+    qc.update("chr1", [bedgraph, other])
+    a = _dense(bedgraph, 50).reshape(-1, 5).mean(axis=1)
+    b = _dense(other, 50).reshape(-1, 5).mean(axis=1)
+    assert np.isclose(qc.pearson().loc["a", "b"], np.corrcoef(a, b)[0, 1])
+    rank_a = np.array([np.mean(np.flatnonzero(np.sort(a) == v)) for v in a])
+    rank_b = np.array([np.mean(np.flatnonzero(np.sort(b) == v)) for v in b])
+    assert np.isclose(qc.spearman().loc["a", "b"], np.corrcoef(rank_a, rank_b)[0, 1])
+
+def test_fingerprints(bedgraph):
+    qc = TrackQC(["a"])
+    qc.update("chr1", [bedgraph])
+    table = qc.fingerprints()
+    assert np.allclose(table["genome_fraction"], [10/50, 15/50, 25/50, 40/50, 1])
+    assert np.allclose(table["signal_fraction"], [0, 5/110, 25/110, 70/110, 1])
+    assert np.allclose(table["fraction_at_least"], [1, 40/50, 35/50, 25/50, 10/50])
+
+def test_binned_without_spearman(bedgraph, other):
+    qc = TrackQC(["a", "b"], binsize=5)
+    qc.update("chr1", [bedgraph, other])
+    assert qc._bins == []
+    with pytest.raises(AssertionError):
+        qc.spearman()
@@ -1,5 +1,6 @@
 import pytest
-from bdgtools.regions import Regions, Region
+import numpy as np
+from bdgtools.regions import Regions, Region, sample_regions
 
 @pytest.fixture
 def regions():
@@ -7,3 +8,51 @@ def regions():
 
 def test_iter(regions):
     assert list(regions) == [(0,3,1), (10,12,-1), (13, 17, 1)]
+
+@pytest.fixture
+def other():
+    return Regions([2, 11, 12, 20], [4, 12, 16, 25], [1, 1, -1, -1])
+
+def test_merge():
+    r = Regions([0, 2, 10, 13, 20], [5, 3, 12, 15, 22])
+    assert r.merge() == Regions([0, 10, 13, 20], [5, 12, 15, 22])
+    assert r.merge(1) == Regions([0, 10, 20], [5, 15, 22])
+
+def test_intersect(regions, other):
+    assert regions.intersect(other) == Regions([2, 11, 13], [3, 12, 16], [1, -1, 1])
+
+def test_subtract(regions, other):
+    assert regions.subtract(other) == Regions([0, 10, 16], [2, 11, 17], [1, -1, 1])
+
+def test_count_overlaps(regions, other):
+    assert list(regions.count_overlaps(other)) == [1, 1, 1]
+
+def test_closest(regions, other):
+    idxs, distances = regions.closest(Regions([5, 30], [6, 31]))
+    assert list(idxs) == [0, 0, 0]
+    assert list(distances) == [3, 5, -8]
+
+def test_closest_same_strand(regions, other):
+    idxs, distances = regions.closest(other, same_strand=True)
+    assert list(idxs) == [0, 2, 1]
+    assert list(distances) == [0, -1, -2]
+
+def test_sample_regions():
+    sizes = np.arange(1, 101)
+    regions = {"chr1": Regions(np.arange(50)*200, np.arange(50)*200+sizes[::2]),
+               "chr2": Regions(np.arange(50)*200, np.arange(50)*200+sizes[1::2])}
+    sampled = sample_regions(regions, n=10, seed=1)
+    sampled_sizes = np.sort(np.concatenate([r.sizes() for r in sampled.values()]))
+    assert sampled_sizes.size == 10
+    assert np.all(sampled_sizes//10 == np.arange(10))
+    assert sample_regions(regions, n=10, seed=1) == sampled
+    assert sum(len(r) for r in sample_regions(regions, fraction=0.25).values()) == 25
+
+def test_unique():
+    regions = Regions([5, 0, 5, 5, 0], [10, 10, 10, 12, 10], [1, 1, -1, 1, 1])
+    assert regions.unique() == Regions([0, 5, 5, 5], [10, 10, 10, 12], [1, -1, 1, 1])
+
+def test_filter_sizes():
+    regions = Regions([0, 5, 10], [3, 15, 50])
+    assert regions.filter_sizes(5, 20) == Regions([5], [15])
+    assert regions.filter_sizes(max_size=10) == Regions([0, 5], [3, 15])
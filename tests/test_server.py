@@ -0,0 +1,89 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from bdgtools.server import TrackStore, make_server, parse_regions, run_plot
+
+@pytest.fixture
+def tracks(tmp_path):
+    paths = []
+    for i in range(2):
+        path = tmp_path / ("track%s.bdg" % i)
+        path.write_text("chr1\t0\t10\t%s\nchr1\t10\t30\t2\nchr2\t0\t20\t1\n" % i)
+        paths.append(str(path))
+    return paths
+
+spec = {"track": "track1.bdg", "plot_type": "tss", "regions": [["chr1", 5, 15, "+"], ["chr2", 2, 12, "-"]],
+        "options": {"figure_width": 10, "region_size": 10, "do_normalize": False}}
+
+def test_parse_regions():
+    regions = parse_regions(spec)
+    assert np.all(regions["chr2"].directions == [-1])
+    assert np.all(regions["chr1"].starts == [5])
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_track_store(tracks, tmp_path, use_mmap):
+    store = TrackStore(tracks, mmap_dir=str(tmp_path / "mmap") if use_mmap else None)
+    track = store.get("track0.bdg")
+    assert track["chr1"] == store.get("track0.bdg")["chr1"]
+    assert np.all(track["chr1"]._values == [0, 2])
+    with pytest.raises(KeyError):
+        store.get("missing.bdg")
+
+def test_compressed_track_store(tracks):
+    store = TrackStore(tracks, compress=True)
+    assert run_plot(store, spec).equals(run_plot(TrackStore(tracks), spec))
+
+def test_track_store_eviction(tracks):
+    store = TrackStore(tracks, max_bytes=1)
+    store.get("track0.bdg")
+    store.get("track1.bdg")
+    assert store.loaded() == ["track1.bdg"]
+
+def test_serve_plot(tracks):
+    store = TrackStore(tracks)
+    server = make_server(store, port=0, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:%s" % server.server_address[1]
+        request = urllib.request.Request(url + "/plot", data=json.dumps(spec).encode(), method="POST")
+        with urllib.request.urlopen(request) as response:
+            result = json.load(response)
+        expected = run_plot(store, spec)
+        assert result["data"] == expected.values.tolist()
+        with urllib.request.urlopen(url + "/tracks") as response:
+            assert json.load(response)["loaded"] == ["track1.bdg"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_region_file_data_dir(tracks, tmp_path):
+    (tmp_path / "regions.bed").write_text("chr1\t5\t15\t.\t.\t+\n")
+    file_spec = dict(spec, regions="regions.bed")
+    assert np.all(parse_regions(file_spec, str(tmp_path))["chr1"].starts == [5])
+    for path in ["../regions.bed", str(tmp_path / "regions.bed")]:
+        with pytest.raises(ValueError):
+            parse_regions(dict(spec, regions=path), str(tmp_path / "data"))
+    with pytest.raises(ValueError):
+        parse_regions(file_spec)
+
+def test_serve_plot_error(tracks):
+    server = make_server(TrackStore(tracks), port=0, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:%s" % server.server_address[1]
+        bad_spec = dict(spec, regions=[["chr1", 15, 5, "+"]])
+        request = urllib.request.Request(url + "/plot", data=json.dumps(bad_spec).encode(), method="POST")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request)
+        assert error.value.code == 400
+        assert "error" in json.load(error.value)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from bdgtools import BedGraph
+from bdgtools.smoothing import binned_means, binned_max, moving_average, gaussian, max_filter
+from .fixtures import bedgraph
+
+def _dense(bedgraph):
+    return np.repeat(bedgraph._values, np.diff(bedgraph._indices, append=bedgraph._size))
+
+def test_binned_means(bedgraph):
+    assert np.all(binned_means(bedgraph, 10) == [0, 1.5, 2.5, 3, 4])
+
+def test_binned_max(bedgraph):
+    assert np.all(binned_max(bedgraph, 10) == [0, 2, 3, 3, 4])
+
+def test_moving_average(bedgraph):
+    dense = _dense(bedgraph)
+    smoothed = _dense(moving_average(bedgraph, 6, resolution=1))
+    true = [dense[max(i-3, 0):i+3].mean() for i in range(50)]
+    assert np.allclose(smoothed, true)
+
+def test_max_filter(bedgraph):
+    dense = _dense(bedgraph)
+    smoothed = _dense(max_filter(bedgraph, 5, resolution=1))
+    true = [dense[max(i-2, 0):i+3].max() for i in range(50)]
+    assert np.all(smoothed == true)
+
+def test_gaussian_constant():
+    bedgraph = BedGraph([0], [3.], size=100)
+    assert np.allclose(_dense(gaussian(bedgraph, 20, resolution=5)), 3)
+
+def test_gaussian_preserves_area(bedgraph):
+    smoothed = gaussian(bedgraph, 3, resolution=1)
+    assert np.isclose(smoothed.sum(), bedgraph.sum(), rtol=0.1)